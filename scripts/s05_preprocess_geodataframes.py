@@ -20,6 +20,7 @@ import sys
 from pathlib import Path
 import geopandas as gpd
 import pandas as pd
+import shapely
 
 # Adicionar raiz do projeto ao path
 PROJECT_ROOT = Path(__file__).parent.parent
@@ -78,7 +79,8 @@ def process_municipalities_geodataframe(shapefile_path, municipios_list):
     try:
         # 1. Carregar shapefile
         logger.info("  Carregando shapefile...")
-        gdf = gpd.read_file(shapefile_path)
+        # pyogrio + Arrow, lendo apenas os atributos usados adiante
+        gdf = gpd.read_file(shapefile_path, engine="pyogrio", use_arrow=True, columns=['CD_MUN', 'NM_MUN'])
         logger.info(f"    ✓ {len(gdf)} geometrias carregadas")
         
         # 2. Reprojetar para WGS84 (EPSG:4326) - Folium espera este CRS
@@ -111,16 +113,17 @@ def process_municipalities_geodataframe(shapefile_path, municipios_list):
         sede_mapper = df_sedes['nm_mun'].to_dict()
         gdf['nm_sede'] = gdf['utp_id'].map(sede_mapper).fillna('')
         
-        # 6. Simplificar geometria - tolerance de 0.002 graus (~200m)
-        logger.info("  Simplificando geometrias...")
-        gdf['geometry'] = gdf.geometry.simplify(tolerance=0.002, preserve_topology=True)
-        logger.info("    ✓ Simplificação concluída")
-        
-        # 7. Manter apenas colunas essenciais
+        # 6. Manter apenas colunas essenciais
         cols_to_keep = ['NM_MUN', 'CD_MUN', 'geometry', 'uf', 'utp_id', 'sede_utp', 'regiao_metropolitana', 'nm_sede']
         existing_cols = [c for c in cols_to_keep if c in gdf.columns]
         gdf = gdf[existing_cols]
         
+        # 7. Simplificar geometria - tolerance de 0.002 graus (~200m)
+        # (ufunc vetorizada do Shapely 2 sobre o array de geometrias já projetado)
+        logger.info("  Simplificando geometrias...")
+        gdf = gdf.set_geometry(shapely.simplify(gdf.geometry.values, 0.002, preserve_topology=True))
+        logger.info("    ✓ Simplificação concluída")
+        
         logger.info(f"  ✓ GeoDataFrame processado: {len(gdf)} municípios")
         return gdf
         
@@ -143,7 +146,7 @@ def process_rm_geodataframe(shapefile_path, municipios_list):
     try:
         # 1. Carregar shapefile bruto (sem simplificação prévia)
         logger.info("  Carregando shapefile bruto...")
-        gdf_raw = gpd.read_file(shapefile_path)
+        gdf_raw = gpd.read_file(shapefile_path, engine="pyogrio", use_arrow=True, columns=['CD_MUN'])
         
         # 2. Preparar dados
         df_mun = pd.DataFrame(municipios_list)
@@ -234,7 +237,7 @@ def process_state_geodataframe(shapefile_path, municipios_list):
     try:
         # 1. Carregar shapefile bruto (sem simplificação prévia)
         logger.info("  Carregando shapefile bruto...")
-        gdf_raw = gpd.read_file(shapefile_path)
+        gdf_raw = gpd.read_file(shapefile_path, engine="pyogrio", use_arrow=True, columns=['CD_MUN'])
         
         # 2. Preparar dados
         df_mun = pd.DataFrame(municipios_list)
@@ -272,10 +272,11 @@ class TerritorialGraph:
         
         joins = gpd.sjoin(gdf_left, gdf_right, predicate='intersects', how='inner')
 
-        for idx_left, row in joins.iterrows():
-            idx_right = row['ID_RIGHT']
-            if str(idx_left) != str(idx_right):
-                G.add_edge(str(idx_left), str(idx_right))
+        # Pares (esquerda, direita) de uma vez, sem iterrows; ignora auto-interseções
+        left_ids = joins.index.astype(str)
+        right_ids = joins['ID_RIGHT'].astype(str)
+        is_pair = left_ids != right_ids
+        G.add_edges_from(zip(left_ids[is_pair], right_ids[is_pair]))
 
         logging.info(f"Grafo de adjacência construído: {G.number_of_nodes()} nós e {G.number_of_edges()} conexões.")
         
@@ -286,11 +287,9 @@ class TerritorialGraph:
         utp_color_map = nx.coloring.greedy_color(G, strategy='DSATUR')
         
         # 5. Mapeamento Final: cd_mun (int) -> cor_id
-        final_coloring = {}
-        for _, row in gdf_clean.iterrows():
-            cd_mun = int(row['CD_MUN'])
-            utp_id = str(row['UTP_ID'])
-            final_coloring[cd_mun] = utp_color_map.get(utp_id, 0)
+        cd_muns = gdf_clean['CD_MUN'].astype('int64').tolist()
+        colors = gdf_clean['UTP_ID'].map(utp_color_map).fillna(0).astype('int64').tolist()
+        final_coloring = dict(zip(cd_muns, colors))
             
         colors_used = max(utp_color_map.values(), default=0) + 1
         logging.info(f"Coloração concluída: {colors_used} cores.")
@@ -1,10 +1,17 @@
 # src/interface/components/map_viewer.py
 import streamlit as st
-import folium
 import geopandas as gpd
 import pandas as pd
+import numpy as np
 import logging
-from typing import Dict, Any, Optional
+import unicodedata
+from pyproj import CRS
+from typing import TYPE_CHECKING, Dict, Any, List, Optional
+
+from src.interface.map_flow_render import simplify_for_display
+
+if TYPE_CHECKING:
+    import folium
 
 # Paleta de Alto Contraste (Cores bem distintas para evitar confusão)
 DISTINCT_COLORS = [
@@ -13,11 +20,56 @@ DISTINCT_COLORS = [
     "#008080", "#E6BEFF", "#9A6324", "#FFFAC8", "#800000"
 ]
 
+# CRS de destino dos mapas, construído uma vez: comparar com a string
+# "EPSG:4326" reconstrói o CRS (parse do WKT) a cada chamada
+WGS84_CRS = CRS.from_epsg(4326)
+
+def normalize_rm_name(name) -> str:
+    """Normaliza nome de RM para comparação (sem acentos, minúsculo, sem espaços extras)."""
+    text = unicodedata.normalize('NFKD', str(name))
+    return ' '.join(text.encode('ascii', 'ignore').decode('ascii').lower().split())
+
+
+def get_rm_name_index(gdf_rm: gpd.GeoDataFrame) -> Dict[str, List[Any]]:
+    """
+    Mapeia nome normalizado da RM -> rótulos no índice do GeoDataFrame de RMs.
+    
+    Uma lista por nome: nomes que colidem após a normalização mantêm todas
+    as RMs. Calculado uma única vez e guardado em gdf_rm.attrs['idx_by_name']
+    (o loader do dashboard já o preenche ao carregar as RMs).
+    """
+    idx_by_name = gdf_rm.attrs.get('idx_by_name')
+    if idx_by_name is None:
+        name_col = 'NOME' if 'NOME' in gdf_rm.columns else 'regiao_metropolitana'
+        idx_by_name = {}
+        if name_col in gdf_rm.columns:
+            for i, n in gdf_rm[name_col].items():
+                if pd.notna(n):
+                    idx_by_name.setdefault(normalize_rm_name(n), []).append(i)
+        gdf_rm.attrs['idx_by_name'] = idx_by_name
+    return idx_by_name
+
+
+def get_coloring_signature(gdf: gpd.GeoDataFrame) -> frozenset:
+    """Assinatura (CD_MUN, UTP_ID) que determina a coloração do mapa."""
+    return frozenset(zip(gdf['CD_MUN'].astype(str), gdf['UTP_ID'].astype(str)))
+
+
+@st.cache_data(show_spinner="Calculando coloração...")
+def get_graph_coloring(coloring_signature: frozenset, _graph, _gdf: gpd.GeoDataFrame) -> Dict[int, int]:
+    """
+    Coloração topológica memoizada pela assinatura da partição.
+    
+    O grafo e o GeoDataFrame (prefixo "_") não entram no hash.
+    """
+    return _graph.compute_graph_coloring(_gdf)
+
+
 def create_interactive_map(gdf: gpd.GeoDataFrame, 
                            coloring: Dict[int, int],
                            seats: Dict[Any, int],
                            gdf_rm: Optional[gpd.GeoDataFrame] = None,
-                           show_rm_borders: bool = False) -> folium.Map:
+                           show_rm_borders: bool = False) -> "folium.Map":
     """
     Cria um mapa interativo com cores sólidas e alto contraste.
     Resolve a diferença de tons usando fillOpacity: 1.0.
@@ -29,32 +81,40 @@ def create_interactive_map(gdf: gpd.GeoDataFrame,
         gdf_rm: GeoDataFrame opcional com geometrias das Regiões Metropolitanas
         show_rm_borders: Se True, adiciona contornos das RMs como camada
     """
+    # folium só é carregado quando um mapa é de fato gerado
+    import folium
+
     m = folium.Map(location=[-15.78, -47.93], zoom_start=4, tiles="CartoDB positron")
     seat_ids = set(seats.values())
     
-    # Simplificação leve para performance
-    gdf_simplified = gdf.copy()
-    gdf_simplified['geometry'] = gdf_simplified.geometry.simplify(tolerance=0.003, preserve_topology=True)
+    # Simplificação leve e coordenadas na grade de 1e-5° (GeoJSON mais curto)
+    gdf_simplified = gdf.copy(deep=False)
+    gdf_simplified['geometry'] = simplify_for_display(gdf_simplified.geometry.values, 0.003)
+    
+    # Cores e status de sede calculados de uma vez para todas as linhas
+    cd_mun_all = pd.to_numeric(gdf_simplified['CD_MUN'], errors='coerce').astype('Int64')
+    palette = np.array(DISTINCT_COLORS)
+    color_idx = cd_mun_all.map(coloring).fillna(0).astype(int).to_numpy() % len(palette)
+    fill_colors = palette[color_idx]
+    is_seed_all = cd_mun_all.isin(seat_ids).fillna(False).to_numpy()
+    nm_mun_all = gdf_simplified['NM_MUN'] if 'NM_MUN' in gdf_simplified.columns else pd.Series('N/A', index=gdf_simplified.index)
+    utp_id_all = gdf_simplified['UTP_ID'] if 'UTP_ID' in gdf_simplified.columns else pd.Series('N/A', index=gdf_simplified.index)
     
-    for _, row in gdf_simplified.iterrows():
+    for cd_mun, nm_mun, utp_id, geometry, fill_color, is_seed in zip(
+        cd_mun_all, nm_mun_all, utp_id_all, gdf_simplified.geometry, fill_colors, is_seed_all
+    ):
+        if pd.isna(cd_mun):
+            logging.error("Erro ao processar município no mapa: CD_MUN inválido")
+            continue
         try:
-            cd_mun = int(row.get('CD_MUN'))
-            nm_mun = row.get('NM_MUN', 'N/A')
-            utp_id = row.get('UTP_ID', 'N/A')
-            
-            # Busca cor sólida do dicionário
-            color_idx = coloring.get(cd_mun, 0) % len(DISTINCT_COLORS)
-            fill_color = DISTINCT_COLORS[color_idx]
-            is_seed = cd_mun in seat_ids
-
             # Popups e Tooltips
             popup_text = f"<b>{nm_mun}</b><br>UTP: {utp_id}<br>Status: {'Sede' if is_seed else 'Membro'}"
             
             # Desenho com Opacidade 1.0 (Resolve a diferença de tons)
-            if row.geometry and row.geometry.geom_type in ['Polygon', 'MultiPolygon']:
+            if geometry and geometry.geom_type in ['Polygon', 'MultiPolygon']:
                 folium.GeoJson(
-                    row.geometry,
-                    style_function=lambda x, fc=fill_color, seed=is_seed: {
+                    geometry,
+                    style_function=lambda x, fc=fill_color, seed=bool(is_seed): {
                         'fillColor': fc,
                         'color': 'black' if seed else '#999999',
                         'weight': 2.0 if seed else 1.0,
@@ -83,50 +143,80 @@ def create_interactive_map(gdf: gpd.GeoDataFrame,
     
     # Adicionar camada de contornos de Regiões Metropolitanas (opcional)
     if show_rm_borders and gdf_rm is not None and not gdf_rm.empty:
-        # ESTRATÉGIA: Matching espacial - verificar quais municípios estão dentro de cada RM do shapefile
+        # ESTRATÉGIA: casar pelo nome da RM dos municípios visíveis; spatial join
+        # apenas para os municípios cujo nome de RM não consta do shapefile
         if 'regiao_metropolitana' in gdf.columns:
             municipios_com_rm = gdf[gdf['regiao_metropolitana'].notna() & 
-                                    (gdf['regiao_metropolitana'] != '')].copy()
+                                    (gdf['regiao_metropolitana'] != '')]
             
             if not municipios_com_rm.empty:
-                # Garantir mesma projeção
-                if gdf_rm.crs != municipios_com_rm.crs:
-                    gdf_rm_proj = gdf_rm.to_crs(municipios_com_rm.crs)
-                else:
-                    gdf_rm_proj = gdf_rm
+                # Ambas as camadas já chegam em EPSG:4326 (loaders e render_maps*)
+                gdf_rm_proj = gdf_rm
                 
-                # Spatial join para encontrar RMs que contêm municípios visíveis
                 try:
-                    joined = gpd.sjoin(municipios_com_rm, gdf_rm_proj, how='left', predicate='intersects')
-                    rms_com_municipios = joined['index_right'].dropna().unique()
+                    # RMs visíveis pelo nome já presente nos municípios (sem predicado geométrico)
+                    rm_name_index = get_rm_name_index(gdf_rm_proj)
+                    rm_names = municipios_com_rm['regiao_metropolitana'].astype(str)
+                    matched_names = {
+                        n for n in rm_names.unique() if normalize_rm_name(n) in rm_name_index
+                    }
+                    rm_labels = [
+                        label for n in matched_names for label in rm_name_index[normalize_rm_name(n)]
+                    ]
+                    
+                    # Nomes que não batem com o shapefile: spatial join só desses municípios
+                    unmatched = municipios_com_rm[~rm_names.isin(matched_names)]
+                    if not unmatched.empty:
+                        joined = gpd.sjoin(unmatched[['geometry']], gdf_rm_proj[['geometry']],
+                                           how='inner', predicate='intersects')
+                        rm_labels.extend(joined['index_right'].tolist())
+                    rms_com_municipios = list(dict.fromkeys(rm_labels))
                     
                     if len(rms_com_municipios) > 0:
-                        gdf_rm_filtered = gdf_rm_proj.iloc[rms_com_municipios].copy()
+                        gdf_rm_filtered = gdf_rm_proj.loc[gdf_rm_proj.index.intersection(rms_com_municipios)]
                         
-                        for idx, row in gdf_rm_filtered.iterrows():
-                            nome_rm = row.get('NOME', 'N/A')
-                            uf = row.get('UF_SIGLA', 'N/A')
-                            num_municipios = int(row.get('MUNICIPIO', 0)) if pd.notna(row.get('MUNICIPIO')) else 0
-                            
-                            tooltip_rm = f"RM: {nome_rm} ({uf}) - {num_municipios} municípios"
-                            
-                            folium.GeoJson(
-                                row.geometry,
-                                style_function=lambda x: {
-                                    'fillColor': 'none',
-                                    'color': '#FF0000',
-                                    'weight': 3,
-                                    'fillOpacity': 0,
-                                    'dashArray': '10, 5'
-                                },
-                                tooltip=tooltip_rm,
-                                name=f"RM: {nome_rm}"
-                            ).add_to(m)
+                        # Uma única FeatureCollection para todas as RMs visíveis
+                        attrs = gdf_rm_filtered.reindex(columns=['NOME', 'UF_SIGLA', 'MUNICIPIO'])
+                        num_municipios = pd.to_numeric(attrs['MUNICIPIO'], errors='coerce').fillna(0).astype(int)
+                        labels = attrs[['NOME', 'UF_SIGLA']].fillna('N/A').astype(str)
+                        gdf_rm_filtered['tooltip'] = (
+                            'RM: ' + labels['NOME'] + ' (' + labels['UF_SIGLA'] + ') - '
+                            + num_municipios.astype(str) + ' municípios'
+                        )
+                        
+                        folium.GeoJson(
+                            gdf_rm_filtered[['tooltip', 'geometry']].to_geo_dict(),
+                            style_function=lambda x: {
+                                'fillColor': 'none',
+                                'color': '#FF0000',
+                                'weight': 3,
+                                'fillOpacity': 0,
+                                'dashArray': '10, 5'
+                            },
+                            tooltip=folium.GeoJsonTooltip(fields=['tooltip'], aliases=[''], labels=False),
+                            name="Regiões Metropolitanas"
+                        ).add_to(m)
                 except Exception as e:
                     logging.error(f"Erro ao fazer spatial join para RMs: {e}")
     
     return m
 
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def get_interactive_map_html(coloring_signature: frozenset, coloring: Dict[int, int], seats: Dict[Any, int],
+                             show_rm_borders: bool, has_rm: bool,
+                             _gdf: gpd.GeoDataFrame, _gdf_rm: Optional[gpd.GeoDataFrame] = None) -> str:
+    """
+    HTML pré-renderizado de create_interactive_map.
+    
+    Guarda só a string HTML: reruns com a mesma partição, coloração e
+    controles não refazem a serialização das geometrias. O GeoDataFrame e as
+    RMs (prefixo "_") não entram no hash.
+    """
+    m = create_interactive_map(_gdf, coloring, seats, _gdf_rm, show_rm_borders)
+    return m._repr_html_()
+
+
 def render_maps(selected_step: str, manager=None, gdf_rm: Optional[gpd.GeoDataFrame] = None, show_rm_borders: bool = False):
     """Renderiza os mapas no Streamlit.
     
@@ -142,16 +232,19 @@ def render_maps(selected_step: str, manager=None, gdf_rm: Optional[gpd.GeoDataFr
     try:
         with st.spinner("Gerando visualização geográfica..."):
             manager.map_generator.sync_with_graph(manager.graph)
-            gdf_map = manager.map_generator.gdf_complete.copy()
-            if gdf_map.crs != "EPSG:4326":
-                gdf_map = gdf_map.to_crs(epsg=4326)
-            coloring = manager.graph.compute_graph_coloring(gdf_map)
+            gdf_map = manager.map_generator.gdf_complete.copy(deep=False)
+            if gdf_map.crs is not None and not gdf_map.crs.equals(WGS84_CRS):
+                gdf_map = gdf_map.to_crs(WGS84_CRS)
+            coloring_signature = get_coloring_signature(gdf_map)
+            coloring = get_graph_coloring(coloring_signature, manager.graph, gdf_map)
             seats = manager.graph.utp_seeds
             
-            m = create_interactive_map(gdf_map, coloring, seats, gdf_rm, show_rm_borders)
+            map_html = get_interactive_map_html(
+                coloring_signature, coloring, seats, show_rm_borders, gdf_rm is not None, gdf_map, gdf_rm
+            )
             
             from streamlit.components.v1 import html
-            html(m._repr_html_(), height=700)
+            html(map_html, height=700)
             
             st.caption(f"Mapa: {selected_step} | Cores distintas: {len(set(coloring.values()))}")
     except Exception as e:
@@ -178,12 +271,15 @@ def render_maps_filtered(selected_step: str, manager, gdf_filtered: gpd.GeoDataF
         return
 
     try:
-        if gdf_filtered.crs != "EPSG:4326":
-            gdf_filtered = gdf_filtered.to_crs(epsg=4326)
+        if gdf_filtered.crs is not None and not gdf_filtered.crs.equals(WGS84_CRS):
+            gdf_filtered = gdf_filtered.to_crs(WGS84_CRS)
             
-        m = create_interactive_map(gdf_filtered, coloring, seats, gdf_rm, show_rm_borders)
+        map_html = get_interactive_map_html(
+            get_coloring_signature(gdf_filtered), coloring, seats, show_rm_borders, gdf_rm is not None,
+            gdf_filtered, gdf_rm
+        )
 
         from streamlit.components.v1 import html
-        html(m._repr_html_(), height=700)
+        html(map_html, height=700)
     except Exception as e:
         st.error(f"Erro no mapa filtrado: {e}")
\ No newline at end of file
@@ -22,7 +22,8 @@ def render_sede_table(df: pd.DataFrame, show_alerts_only: bool = False) -> None:
         st.info("Nenhum dado disponível para visualização.")
         return
     
-    df_display = df.copy()
+    # Sem cópia: o filtro por máscara já devolve um novo DataFrame
+    df_display = df
     
     # Filtrar apenas alertas se solicitado
     if show_alerts_only:
@@ -65,7 +66,7 @@ def render_dependency_alerts(df: pd.DataFrame) -> None:
     Args:
         df: DataFrame com dados das sedes
     """
-    df_alerts = df[df['Alerta'] == 'SIM'].copy()
+    df_alerts = df[df['Alerta'] == 'SIM']
     
     if df_alerts.empty:
         st.success("**Nenhuma dependência funcional detectada**")
@@ -114,7 +115,7 @@ def render_socioeconomic_charts(df: pd.DataFrame) -> None:
     # Gráfico 1: Top 15 Sedes por População
     st.markdown("#### Top 15 Sedes por População")
     
-    df_top_pop = df.nlargest(15, 'População').copy()
+    df_top_pop = df.nlargest(15, 'População')
     
     # Adicionar cor baseada em alerta
     df_top_pop['cor'] = df_top_pop['Alerta'].map({
@@ -158,16 +159,15 @@ def render_regic_distribution(df: pd.DataFrame) -> None:
     
     st.markdown("#### Distribuição por Classificação REGIC")
     
-    # Filtrar apenas sedes com classificação REGIC
-    df_regic = df[df['REGIC'] != ''].copy()
+    # Contar por classificação (apenas sedes com REGIC), já em ordem decrescente
+    regic_counts = df['REGIC'].astype('category').value_counts()
+    regic_counts = regic_counts[(regic_counts > 0) & (regic_counts.index != '')]
     
-    if df_regic.empty:
+    if regic_counts.empty:
         st.info("Nenhuma sede com classificação REGIC disponível")
         return
     
-    # Contar por classificação
-    regic_counts = df_regic.groupby('REGIC').size().reset_index(name='Quantidade')
-    regic_counts = regic_counts.sort_values('Quantidade', ascending=False)
+    regic_counts = regic_counts.rename_axis('REGIC').reset_index(name='Quantidade')
     
     # Criar gráfico de barras
     fig_regic = px.bar(
@@ -209,7 +209,8 @@ def render_origin_destination_table(df: pd.DataFrame, show_alerts_only: bool = F
         st.caption("Não há sedes cujo principal fluxo vai para outra sede.")
         return
     
-    df_display = df.copy()
+    # Sem cópia: o filtro por máscara já devolve um novo DataFrame
+    df_display = df
     
     # Filtrar apenas alertas se solicitado
     if show_alerts_only:
@@ -308,7 +309,8 @@ def render_comprehensive_table(df: pd.DataFrame, show_alerts_only: bool = False)
         st.info("Nenhuma relação origem-destino detectada.")
         return
     
-    df_display = df.copy()
+    # Sem cópia: o filtro por máscara já devolve um novo DataFrame
+    df_display = df
     
     # Filtrar apenas alertas se solicitado
     if show_alerts_only:
@@ -156,6 +156,17 @@ class ConsolidationLoader:
         
         return current
     
+    def _resolve_utp_column(self, utp_ids: pd.Series, mapping: dict) -> pd.Series:
+        """Resolve as cadeias de consolidação uma vez por UTP distinta (não por linha)."""
+        resolved = {utp_id: self._resolve_mapping_chain(utp_id, mapping) for utp_id in utp_ids.dropna().unique()}
+        # Valores como object: em colunas categóricas o map preservaria as categorias
+        # e os passos seguintes (fillna/novas UTPs) falhariam
+        return utp_ids.astype(object).map(resolved)
+    
+    def get_post_unitary_token(self) -> tuple:
+        """Chave de cache do estado pós-unitárias (status + mapeamento)."""
+        return self.is_post_unitary_executed(), frozenset(self.get_post_unitary_mapping().items())
+    
     def compute_mapping_from_list(self, consolidations: List[Dict]) -> Dict:
         """Computa o mapeamento source->target a partir de uma lista de consolidações."""
         mapping = {}
@@ -193,9 +204,7 @@ class ConsolidationLoader:
             
             # 3. Aplicar o mapeamento de UTP IDs RESOLVENDO CADEIAS
             # Importante: seguir toda a cadeia de consolidações (ex: 131->152->672)
-            df_consolidated['utp_id'] = df_consolidated['utp_id'].apply(
-                lambda x: self._resolve_mapping_chain(x, mapping)
-            )
+            df_consolidated['utp_id'] = self._resolve_utp_column(df_consolidated['utp_id'], mapping)
             
             # 4. Atualizar o nome da sede (nm_sede) se a coluna existir
             # Precisamos mapear o UTP_ID final para o nome da sede real daquela UTP
@@ -329,9 +338,7 @@ class ConsolidationLoader:
         changing_mask = df_consolidated['utp_id'].isin(mapping.keys())
         df_consolidated.loc[changing_mask, 'sede_utp'] = False
         
-        df_consolidated['utp_id'] = df_consolidated['utp_id'].apply(
-            lambda x: self._resolve_mapping_chain(x, mapping)
-        )
+        df_consolidated['utp_id'] = self._resolve_utp_column(df_consolidated['utp_id'], mapping)
         
         if 'nm_sede' in df_consolidated.columns:
             sedes_atuais = df_consolidated[df_consolidated['sede_utp'] == True]
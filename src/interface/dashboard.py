@@ -1,9 +1,12 @@
 # src/interface/dashboard.py
 import streamlit as st
 import pandas as pd
+import numpy as np
 import geopandas as gpd
-import folium
 import json
+import gzip
+import orjson
+import hashlib
 import logging
 from pathlib import Path
 from datetime import datetime
@@ -11,16 +14,15 @@ from src.utils import DataLoader
 from src.interface.consolidation_loader import ConsolidationLoader
 from src.interface.snapshot_loader import SnapshotLoader
 from src.run_consolidation import run_consolidation
-from src.pipeline.sede_analyzer import SedeAnalyzer
 from src.interface.components import sede_comparison
-from src.core.graph import TerritorialGraph
+from src.interface.components.map_viewer import WGS84_CRS, get_rm_name_index
 from src.interface.flow_utils import (
     get_top_municipalities_in_utp,
     get_top_destinations_for_municipality,
     format_flow_popup_html,
     get_municipality_total_flow
 )
-from src.interface.map_flow_render import render_map_with_flow_popups
+from src.interface.map_flow_render import render_map_with_flow_popups, simplify_for_display
 
 
 # ===== CONFIGURAÇÃO DA PÁGINA =====
@@ -100,14 +102,58 @@ from src.interface.palette import get_palette
 # Carregar Paleta Ativa
 PASTEL_PALETTE = get_palette()
 
-
-@st.cache_data(show_spinner="Carregando mapa...", hash_funcs={gpd.GeoDataFrame: id, pd.DataFrame: id})
-def get_geodataframe(optimized_geojson_path, df_municipios):
+# Acima deste número de municípios o mapa da visão inicial é desenhado como imagem
+MAP_RASTER_THRESHOLD = 300
+
+# Mapeamento das colunas do border_validation_result.json para as tabelas do Step 8
+_REL_COLS = {
+    'mun_name': 'Município',
+    'mun_id': 'CD_MUN',
+    'utp_origem': 'UTP Origem',
+    'utp_destino': 'UTP Destino',
+    'iteration': 'Iteração',
+    'reason': 'Motivo'
+}
+_REJ_COLS = {
+    'mun_name': 'Município',
+    'mun_id': 'CD_MUN',
+    'utp_origem': 'UTP Atual',
+    'proposed_utp': 'UTP Proposta',
+    'reason': 'Motivo',
+    'details': 'Detalhes',
+    'iteration': 'Iteração'
+}
+
+
+# Atributos de df_municipios re-mesclados nas geometrias (get_geodataframe)
+GEO_ATTR_COLS = ['cd_mun', 'uf', 'utp_id', 'sede_utp', 'regiao_metropolitana', 'nm_mun']
+UTP_SUMMARY_COLS = [
+    'utp_id', 'nm_mun', 'uf', 'sede_utp', 'populacao_2022', 'area_km2',
+    'turismo_classificacao', 'regic', 'regiao_metropolitana'
+]
+GEO_CATEGORY_COLS = ['uf', 'utp_id', 'regiao_metropolitana', 'nm_sede']
+
+
+def hash_dataframe(df):
+    """Hash de conteúdo de um DataFrame (colunas hasheáveis), usado como chave de cache."""
+    return int(pd.util.hash_pandas_object(df, index=False).sum())
+
+
+@st.cache_data(show_spinner="Carregando mapa...")
+def get_geodataframe(optimized_geojson_path, data_key, _df_municipios):
     """
     Carrega o GeoDataFrame pré-processado de municípios.
     
     Se o arquivo otimizado não existir (gerado pelo pipeline main.py),
     exibe um aviso e retorna None.
+    
+    A chave em memória é data_key (mtime do GeoJSON + número de
+    linhas de _df_municipios, calculada pelo chamador): o DataLoader mantém o
+    initialization.json carregado por processo, então o frame não é
+    hasheado a cada rerun. O resultado também é persistido em GeoParquet
+    (data/04_maps/cache), chaveado pelo mtime do GeoJSON e pelo hash de
+    conteúdo de _df_municipios, para que reinícios a frio não refaçam a
+    leitura e o merge.
     """
     if not optimized_geojson_path.exists():
         st.warning("""
@@ -121,36 +167,64 @@ def get_geodataframe(optimized_geojson_path, df_municipios):
         """)
         return None
 
+    # Cache em disco (GeoParquet)
+    cache_key = hashlib.md5(
+        f"{optimized_geojson_path.stat().st_mtime}-{hash_dataframe(_df_municipios)}".encode()
+    ).hexdigest()
+    cache_dir = optimized_geojson_path.parent / "cache"
+    cache_path = cache_dir / f"municipalities_{cache_key}.parquet"
+    if cache_path.exists():
+        try:
+            gdf = gpd.read_parquet(cache_path)
+            gdf.attrs['cache_key'] = cache_key
+            return gdf
+        except Exception as e:
+            logging.warning(f"Cache GeoParquet inválido, recalculando: {e}")
+
     try:
         # Carregar GeoJSON pré-processado
-        gdf = gpd.read_file(optimized_geojson_path)
+        # Apenas geometria + chaves: os atributos de UTP são re-mesclados abaixo
+        gdf = gpd.read_file(optimized_geojson_path, engine="pyogrio", use_arrow=True, columns=['CD_MUN', 'NM_MUN'])
         
         # Atualizar com dados mais recentes do df_municipios
         # (caso o initialization.json tenha sido alterado após o pré-processamento)
-        df_mun_copy = df_municipios.copy()
-        df_mun_copy['cd_mun'] = df_mun_copy['cd_mun'].astype(str)
+        df_mun = _df_municipios.loc[:, GEO_ATTR_COLS].assign(cd_mun=_df_municipios['cd_mun'].astype(str))
         gdf['CD_MUN'] = gdf['CD_MUN'].astype(str)
         
         # Re-merge para garantir dados atualizados
         gdf = gdf.drop(columns=['uf', 'utp_id', 'sede_utp', 'regiao_metropolitana', 'nm_sede'], errors='ignore')
-        gdf = gdf.merge(
-            df_mun_copy[['cd_mun', 'uf', 'utp_id', 'sede_utp', 'regiao_metropolitana', 'nm_mun']], 
-            left_on='CD_MUN', right_on='cd_mun', how='left'
-        )
+        gdf = gdf.merge(df_mun, left_on='CD_MUN', right_on='cd_mun', how='left')
         
         # Recalcular nomes das sedes
-        df_sedes = df_mun_copy[df_mun_copy['sede_utp'] == True][['utp_id', 'nm_mun']].set_index('utp_id')
+        df_sedes = df_mun[df_mun['sede_utp'] == True][['utp_id', 'nm_mun']].set_index('utp_id')
         sede_mapper = df_sedes['nm_mun'].to_dict()
-        gdf['nm_sede'] = gdf['utp_id'].map(sede_mapper).fillna('')
+        # utp_id pode ser categórico: o map volta a ser categórico quando é um-para-um,
+        # e fillna('') falharia com uma categoria nova
+        gdf['nm_sede'] = gdf['utp_id'].map(sede_mapper).astype(object).fillna('')
         gdf['regiao_metropolitana'] = gdf['regiao_metropolitana'].fillna('')
         
+        # Colunas de baixa cardinalidade como category (menos memória, groupby mais rápido)
+        for col in GEO_CATEGORY_COLS:
+            gdf[col] = gdf[col].astype('category')
+        gdf['sede_utp'] = gdf['sede_utp'].fillna(False).astype(bool)
+        
+        # Persistir e descartar versões antigas do cache
+        try:
+            cache_dir.mkdir(parents=True, exist_ok=True)
+            for stale in cache_dir.glob("municipalities_*.parquet"):
+                stale.unlink()
+            gdf.to_parquet(cache_path, compression='zstd')
+        except Exception as e:
+            logging.warning(f"Não foi possível salvar cache GeoParquet: {e}")
+        
+        gdf.attrs['cache_key'] = cache_key
         return gdf
     except Exception as e:
         st.error(f"Erro ao carregar mapa otimizado: {e}")
         return None
 
 
-@st.cache_data(show_spinner="Carregando RMs...", hash_funcs={gpd.GeoDataFrame: id})
+@st.cache_data(show_spinner="Carregando RMs...")
 def get_derived_rm_geodataframe(optimized_rm_geojson_path):
     """
     Carrega o GeoDataFrame pré-processado de Regiões Metropolitanas.
@@ -164,7 +238,14 @@ def get_derived_rm_geodataframe(optimized_rm_geojson_path):
     
     try:
         # Carregar GeoJSON pré-processado
-        gdf_rm = gpd.read_file(optimized_rm_geojson_path)
+        gdf_rm = gpd.read_file(optimized_rm_geojson_path, engine="pyogrio", use_arrow=True)
+        
+        # Reprojetar uma única vez aqui: os mapas assumem EPSG:4326
+        if gdf_rm.crs is not None and not gdf_rm.crs.equals(WGS84_CRS):
+            gdf_rm = gdf_rm.to_crs(WGS84_CRS)
+        
+        # Índice nome normalizado -> RM, guardado em gdf_rm.attrs para os renders
+        get_rm_name_index(gdf_rm)
         return gdf_rm
         
     except Exception as e:
@@ -172,7 +253,7 @@ def get_derived_rm_geodataframe(optimized_rm_geojson_path):
         return None
 
 
-@st.cache_data(show_spinner="Carregando Estados...", hash_funcs={gpd.GeoDataFrame: id})
+@st.cache_data(show_spinner="Carregando Estados...")
 def get_derived_state_geodataframe(optimized_state_geojson_path):
     """
     Carrega o GeoDataFrame pré-processado de Estados.
@@ -181,56 +262,28 @@ def get_derived_state_geodataframe(optimized_state_geojson_path):
         return None
     
     try:
-        gdf_states = gpd.read_file(optimized_state_geojson_path)
+        gdf_states = gpd.read_file(optimized_state_geojson_path, engine="pyogrio", use_arrow=True)
+        if 'uf' in gdf_states.columns:
+            gdf_states['uf'] = gdf_states['uf'].astype('category')
         return gdf_states
     except Exception as e:
         logging.error(f"Erro ao carregar Estados otimizados: {e}")
         return None
 
 
-@st.cache_resource(show_spinner="Construindo Grafo Territorial...")
-def get_territorial_graph(df_municipios):
+@st.cache_data(show_spinner="Carregando coloração pré-calculada...")
+def read_coloring_cache(cache_path_str, mtime):
     """
-    Cria e cacheia o grafo territorial completo.
-    Evita recriação a cada renderização.
+    Lê o JSON de coloração (cd_mun -> color_index).
+    
+    Chaveado por caminho + mtime: só relê quando o pipeline regravar o arquivo.
     """
-    if df_municipios is None or df_municipios.empty:
-        return None
-        
-    try:
-        graph = TerritorialGraph()
-        # Carregar estrutura do grafo a partir dos dados
-        for _, row in df_municipios.iterrows():
-            cd_mun = int(row['cd_mun'])
-            nm_mun = row.get('nm_mun', str(cd_mun))
-            utp_id = str(row.get('utp_id', 'SEM_UTP'))
-            rm_name = row.get('regiao_metropolitana', '')
-            
-            if not rm_name or str(rm_name).strip() == '':
-                rm_name = "SEM_RM"
-            
-            # Criar hierarquia no grafo
-            rm_node = f"RM_{rm_name}"
-            if not graph.hierarchy.has_node(rm_node):
-                graph.hierarchy.add_node(rm_node, type='rm', name=rm_name)
-                graph.hierarchy.add_edge(graph.root, rm_node)
-            
-            utp_node = f"UTP_{utp_id}"
-            if not graph.hierarchy.has_node(utp_node):
-                graph.hierarchy.add_node(utp_node, type='utp', utp_id=utp_id)
-                graph.hierarchy.add_edge(rm_node, utp_node)
-            
-            graph.hierarchy.add_node(cd_mun, type='municipality', name=nm_mun)
-            graph.hierarchy.add_edge(utp_node, cd_mun)
-        
-        logging.info(f"Grafo territorial criado: {len(graph.hierarchy.nodes)} nós")
-        return graph
-    except Exception as e:
-        logging.error(f"Erro ao criar grafo territorial: {e}")
-        return None
+    with open(cache_path_str, "r") as f:
+        coloring_str_keys = json.load(f)
+    # JSON chaves são sempre strings, converter para int
+    return {int(k): v for k, v in coloring_str_keys.items()}
 
 
-@st.cache_data(show_spinner="Carregando coloração pré-calculada...", hash_funcs={gpd.GeoDataFrame: id, pd.DataFrame: id})
 def load_or_compute_coloring(gdf, cache_filename="initial_coloring.json"):
     """
     Carrega a coloração pré-calculada do cache.
@@ -256,12 +309,9 @@ def load_or_compute_coloring(gdf, cache_filename="initial_coloring.json"):
     # Tentar carregar do arquivo
     if cache_path.exists():
         try:
-            with open(cache_path, "r") as f:
-                coloring_str_keys = json.load(f)
-                # JSON chaves são sempre strings, converter para int
-                coloring = {int(k): v for k, v in coloring_str_keys.items()}
-                logging.info(f"✅ Coloração carregada do cache: {len(coloring)} municípios")
-                return coloring
+            coloring = read_coloring_cache(str(cache_path), cache_path.stat().st_mtime)
+            logging.info(f"✅ Coloração carregada do cache: {len(coloring)} municípios")
+            return coloring
         except Exception as e:
             logging.error(f"❌ Erro ao ler cache de coloração: {e}")
             st.error(f"Erro ao carregar cache de coloração: {e}")
@@ -284,28 +334,176 @@ def load_or_compute_coloring(gdf, cache_filename="initial_coloring.json"):
     return {}
 
 
-@st.cache_data(show_spinner="Calculando contornos estaduais...", hash_funcs={gpd.GeoDataFrame: id})
-def get_state_boundaries(gdf):
+@st.cache_data(show_spinner="Calculando contornos estaduais...")
+def get_state_boundaries(gdf_token, _gdf):
     """
     Calcula os contornos dos estados dissolvendo os municípios.
+    
+    gdf_token (chave de conteúdo do GeoDataFrame) identifica _gdf, que não
+    entra no hash: id() poderia ser reaproveitado após coleta de lixo.
     """
-    if gdf is None or gdf.empty:
+    if _gdf is None or _gdf.empty:
         return None
         
     try:
         # Dissolver por UF
-        gdf_states = gdf[['uf', 'geometry']].dissolve(by='uf').reset_index()
+        gdf_states = _gdf[['uf', 'geometry']].dissolve(by='uf', observed=True).reset_index()
         return gdf_states
     except Exception as e:
         logging.error(f"Erro ao calcular contornos estaduais: {e}")
         return None
 
 
+@st.cache_resource(show_spinner=False)
+def get_gdf_by_cd_mun(gdf_token, _gdf):
+    """
+    Indexa o GeoDataFrame de municípios por CD_MUN (mantendo a coluna).
+    
+    Permite selecionar poucos municípios por lookup no índice, sem
+    varrer o frame nacional inteiro a cada renderização. Chaveado por
+    gdf_token, como filter_gdf.
+    """
+    return _gdf.set_index('CD_MUN', drop=False).rename_axis(None)
+
+
+def get_snapshot_colors(gdf):
+    """Coloração {cd_mun: color_id} gravada no snapshot, lida coluna a coluna."""
+    col_cd = 'CD_MUN' if 'CD_MUN' in gdf.columns else 'cd_mun'
+    return dict(zip(gdf[col_cd].astype('int64').tolist(), gdf['color_id'].astype('int64').tolist()))
+
+
+@st.cache_data(show_spinner=False)
+def get_file_bytes(path_str, mtime):
+    """
+    Lê o conteúdo bruto de um artefato para download.
+    
+    O mtime faz parte da chave do cache: o arquivo só é relido quando
+    o pipeline gerar uma nova versão.
+    """
+    return Path(path_str).read_bytes()
+
+
+@st.cache_resource(show_spinner=False, max_entries=32)
+def filter_gdf(gdf_token, ufs, utps, _gdf):
+    """
+    Recorte do GeoDataFrame pelos filtros de UF/UTP, memoizado.
+    
+    gdf_token identifica o conteúdo de _gdf (que não entra no hash). O
+    recorte é compartilhado entre reruns: quem precisar alterá-lo deve copiar.
+    ufs=None significa "Brasil Completo" (sem filtro de UF).
+    """
+    if ufs is None and not utps:
+        return _gdf
+    mask = _gdf['uf'].isin(ufs) if ufs is not None else _gdf['utp_id'].isin(utps)
+    if ufs is not None and utps:
+        mask &= _gdf['utp_id'].isin(utps)
+    if mask.all():
+        return _gdf
+    return _gdf[mask]
+
+
+@st.cache_resource(show_spinner=False, max_entries=16)
+def get_post_unitary_geodataframe(gdf_token, consolidation_token, _gdf, _consolidation_loader):
+    """
+    Aplica as consolidações pós-unitárias ao recorte, memoizado.
+    
+    Chaveado pelo token do recorte e pelo estado/mapeamento pós-unitárias,
+    de modo que só recalcula quando surgirem novas consolidações.
+    """
+    return _consolidation_loader.apply_post_unitary_to_dataframe(_gdf)
 
 
+def get_export_timestamp():
+    """
+    Carimbo de data/hora dos arquivos exportados, fixado uma vez por sessão.
+    
+    Um nome de arquivo novo a cada rerun muda a identidade dos botões de
+    download e força o Streamlit a recriá-los.
+    """
+    if '_export_ts' not in st.session_state:
+        st.session_state['_export_ts'] = datetime.now().strftime('%Y%m%d_%H%M%S')
+    return st.session_state['_export_ts']
 
 
-def render_territorial_config_table(step_key: str, snapshot_loader: "SnapshotLoader", allowed_cd_mun: set = None) -> pd.DataFrame:
+@st.cache_data(show_spinner=False)
+def get_consolidation_result_bytes(result_path_str, mtime, _result):
+    """
+    JSON do resultado de consolidação para download, serializado uma vez
+    por versão do arquivo (caminho + mtime) em vez de a cada rerun.
+    
+    orjson já emite bytes UTF-8, sem a string intermediária do json.dumps;
+    o payload é entregue em gzip (JSON textual comprime várias vezes).
+    """
+    return gzip.compress(orjson.dumps(
+        _result,
+        option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+    ), compresslevel=6)
+
+
+MAP_SIGNATURE_COLS = ['CD_MUN', 'cd_mun', 'utp_id', 'uf', 'sede_utp', 'color_id']
+
+
+def get_map_signature(gdf_filtered):
+    """Assinatura de conteúdo do recorte exibido no mapa (sem geometria)."""
+    cols = [c for c in MAP_SIGNATURE_COLS if c in gdf_filtered.columns]
+    return hash_dataframe(gdf_filtered[cols].astype(str))
+
+
+def get_map_options_token(map_options):
+    """
+    Chave barata das opções do mapa que não entram na assinatura do recorte:
+    cores, opções escalares (título, paleta, limiar de raster) e as camadas
+    de RM/Estados (tamanho + extensão).
+    """
+    def layer_token(layer):
+        if layer is None or layer.empty:
+            return None
+        return (len(layer), tuple(layer.total_bounds.round(6)))
+    
+    colors = map_options.get('global_colors')
+    palette = map_options.get('PASTEL_PALETTE')
+    return (
+        hash(frozenset(colors.items())) if colors else None,
+        map_options.get('title'),
+        map_options.get('raster_threshold'),
+        tuple(palette) if palette is not None else None,
+        layer_token(map_options.get('gdf_rm')),
+        layer_token(map_options.get('gdf_states')),
+    )
+
+
+@st.cache_data(show_spinner="Gerando mapa...", ttl=3600, max_entries=64)
+def build_map_html(step_key, map_signature, selected_ufs, show_rm_borders, show_state_borders,
+                   options_token, _gdf_filtered, _df_municipios, _map_options):
+    """
+    Gera o HTML do mapa folium, memoizado pela assinatura do recorte.
+    
+    Guarda apenas a string HTML (não o objeto Map). Os argumentos com
+    prefixo "_" não entram no hash: a chave é o step, a assinatura dos
+    dados filtrados, as UFs selecionadas, os controles de contorno e
+    options_token (get_map_options_token das opções do mapa).
+    """
+    m = render_map_with_flow_popups(
+        _gdf_filtered,
+        _df_municipios,
+        show_rm_borders=show_rm_borders,
+        show_state_borders=show_state_borders,
+        step_key=step_key,
+        **_map_options
+    )
+    return m._repr_html_() if m else None
+
+
+def get_map_html(step_key, map_signature, selected_ufs, show_rm_borders, show_state_borders,
+                 gdf_filtered, df_municipios, map_options):
+    """HTML do mapa via build_map_html, com a chave das opções calculada aqui."""
+    return build_map_html(
+        step_key, map_signature, selected_ufs, show_rm_borders, show_state_borders,
+        get_map_options_token(map_options), gdf_filtered, df_municipios, map_options
+    )
+
+
+def render_territorial_config_table(step_key: str, snapshot_loader: "SnapshotLoader", allowed_cd_mun: np.ndarray = None) -> pd.DataFrame:
     """
     Builds a territorial configuration table from a snapshot.
 
@@ -318,7 +516,7 @@ def render_territorial_config_table(step_key: str, snapshot_loader: "SnapshotLoa
     Args:
         step_key: snapshot key ('step1', 'step5', 'step6', 'step8')
         snapshot_loader: SnapshotLoader instance
-        allowed_cd_mun: optional set of cd_mun strings to filter municipalities.
+        allowed_cd_mun: optional array of cd_mun codes (any dtype) to filter municipalities.
                         If None, all municipalities in the snapshot are shown.
 
     Returns:
@@ -330,14 +528,15 @@ def render_territorial_config_table(step_key: str, snapshot_loader: "SnapshotLoa
 
     nodes = data.get("nodes", {})
 
-    # Collect municipality-level nodes only
-    utps: dict[str, dict] = {}  # utp_id -> {sede, municipios: list}
-    for node_id, attrs in nodes.items():
-        if not node_id.isdigit():
-            continue
-        if allowed_cd_mun is not None and node_id not in allowed_cd_mun:
-            continue
+    # Collect municipality-level nodes only (vectorized filter over node ids)
+    node_ids = pd.Index(list(nodes.keys()), dtype=str)
+    mask = node_ids.str.isdigit()
+    if allowed_cd_mun is not None:
+        mask &= node_ids.isin(pd.Index(allowed_cd_mun).astype(str))
 
+    utps: dict[str, dict] = {}  # utp_id -> {sede, municipios: list}
+    for node_id in node_ids[mask]:
+        attrs = nodes[node_id]
         utp_id = str(attrs.get("utp_id", "SEM_UTP"))
         name = attrs.get("name", node_id)
         is_sede = bool(attrs.get("sede_utp", False))
@@ -367,6 +566,17 @@ def render_territorial_config_table(step_key: str, snapshot_loader: "SnapshotLoa
     return df
 
 
+@st.cache_data(show_spinner=False)
+def get_territorial_config_table(step_key: str, snapshot_mtime, allowed_cd_mun, _snapshot_loader: "SnapshotLoader") -> pd.DataFrame:
+    """
+    Versão cacheada de render_territorial_config_table.
+
+    A chave do cache é (step_key, mtime do snapshot, cd_mun permitidos);
+    o loader não entra no hash (prefixo "_").
+    """
+    return render_territorial_config_table(step_key, _snapshot_loader, allowed_cd_mun)
+
+
 def create_enriched_utp_summary(df_municipios):
     """
     Cria resumo enriquecido das UTPs com métricas territoriais relevantes.
@@ -375,141 +585,130 @@ def create_enriched_utp_summary(df_municipios):
         df_municipios: DataFrame com dados dos municípios
         
     Returns:
-        DataFrame com métricas agregadas por UTP
+        DataFrame com métricas agregadas por UTP (População e Viagens numéricas;
+        a formatação fica em style_utp_summary). A coluna auxiliar _n_aero
+        guarda a contagem de aeroportos para as estatísticas e não é exibida.
     """
     if df_municipios.empty:
         return pd.DataFrame()
     
-    # Preparar dados
-    df = df_municipios.copy()
+    # Preparar dados: apenas as colunas escalares usadas (índice posicional).
+    # Os dicts de modais/aeroporto são lidos direto da origem, sem copiar o frame inteiro.
+    df = df_municipios[[c for c in UTP_SUMMARY_COLS if c in df_municipios.columns]].reset_index(drop=True)
+    modais = df_municipios['modais'].tolist() if 'modais' in df_municipios.columns else None
+    aeroportos = pd.Series(df_municipios['aeroporto'].to_numpy(), index=df.index) if 'aeroporto' in df_municipios.columns else None
     
     # Garantir types numéricos
     numeric_cols = ['populacao_2022', 'area_km2']
     for col in numeric_cols:
         if col in df.columns:
             df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
+    if 'populacao_2022' in df.columns:
+        df['populacao_2022'] = pd.to_numeric(df['populacao_2022'], downcast='integer')
     
-    # Agregar viagens por município
-    df['total_viagens'] = 0
-    if 'modais' in df.columns:
-        df['total_viagens'] = df['modais'].apply(
-            lambda x: sum(x.values()) if isinstance(x, dict) else 0
+    # Expandir os dicionários de modais em uma coluna numérica por modal
+    if modais is not None:
+        df_modais = pd.DataFrame.from_records(
+            [m if isinstance(m, dict) else {} for m in modais], index=df.index
+        ).apply(pd.to_numeric, errors='coerce').fillna(0)
+    else:
+        df_modais = pd.DataFrame(index=df.index)
+    
+    # Agregar viagens por município e identificar modal dominante
+    modal_map = {
+        'rodoviaria_coletiva': 'Rod. Coletiva',
+        'rodoviaria_particular': 'Rod. Particular',
+        'aeroviaria': 'Aérea',
+        'ferroviaria': 'Ferroviária',
+        'hidroviaria': 'Hidroviária'
+    }
+    if df_modais.columns.empty:
+        df['total_viagens'] = 0
+        df['modal_dominante'] = ''
+    else:
+        df['total_viagens'] = df_modais.sum(axis=1)
+        df['modal_dominante'] = (
+            df_modais.idxmax(axis=1).replace(modal_map).where(df_modais.max(axis=1) > 0, '')
         )
     
-    # Identificar modal dominante
-    def get_modal_dominante(modais):
-        if not isinstance(modais, dict) or not modais:
-            return ''
-        max_modal = max(modais.items(), key=lambda x: x[1])
-        if max_modal[1] == 0:
-            return ''
-        # Simplificar nomes
-        modal_map = {
-            'rodoviaria_coletiva': 'Rod. Coletiva',
-            'rodoviaria_particular': 'Rod. Particular',
-            'aeroviaria': 'Aérea',
-            'ferroviaria': 'Ferroviária',
-            'hidroviaria': 'Hidroviária'
-        }
-        return modal_map.get(max_modal[0], max_modal[0])
-    
-    df['modal_dominante'] = df['modais'].apply(get_modal_dominante) if 'modais' in df.columns else ''
-    
-    # Agrupar por UTP
-    summary_list = []
-    
-    for utp_id, group in df.groupby('utp_id'):
-        # Identificar sede
-        sede_row = group[group['sede_utp'] == True]
-        if sede_row.empty:
-            continue
-        
-        sede = sede_row.iloc[0]
-        
-        # População
-        pop_total = group['populacao_2022'].sum()
-        
-        # Maior município
-        maior_mun = group.loc[group['populacao_2022'].idxmax()]
-        maior_mun_nome = f"{maior_mun['nm_mun']} ({maior_mun['populacao_2022']:,.0f})"
+    # Agregados por UTP em um único groupby (inclui o rótulo do maior município;
+    # idxmax devolve a primeira ocorrência em empates)
+    agg = df.groupby('utp_id', observed=True).agg(
+        n_mun=('nm_mun', 'size'),
+        populacao=('populacao_2022', 'sum'),
+        viagens=('total_viagens', 'sum'),
+        idx_max=('populacao_2022', 'idxmax'),
+    )
+    
+    # Maior município: leitura posicional das linhas apontadas por idx_max
+    maior = df.loc[agg['idx_max'], ['nm_mun', 'populacao_2022']].set_axis(agg.index)
+    agg['maior_mun'] = maior['nm_mun'] + ' (' + maior['populacao_2022'].map('{:,.0f}'.format) + ')'
+    
+    # Sede (primeira por UTP); UTPs sem sede ficam fora do resumo
+    sede = df[df['sede_utp'] == True].drop_duplicates('utp_id').set_index('utp_id')
+    agg = agg.join(sede[['nm_mun', 'uf', 'modal_dominante']], how='inner')
+    
+    def sede_text(col):
+        raw = sede[col] if col in sede.columns else pd.Series(pd.NA, index=sede.index)
+        raw = raw.reindex(agg.index).astype('string')
+        return raw.mask(raw.str.strip() == '')
+    
+    # Turismo: apenas primeira parte da categoria, antes do hífen
+    turismo = sede_text('turismo_classificacao').str.split('-').str[0].str.strip().fillna('-')
+    
+    # Aeroportos na UTP
+    aeroporto_display = pd.Series('-', index=agg.index, dtype=object)
+    n_aero = pd.Series(0, index=agg.index, dtype='int64')
+    if aeroportos is not None:
+        is_aero = aeroportos.map(lambda a: isinstance(a, dict)).astype(bool)
+        df_aero = pd.json_normalize(aeroportos[is_aero].tolist())
+        df_aero.index = df.index[is_aero]
         
-        # Turismo
-        turismo_cat = sede.get('turismo_classificacao', '')
-        if pd.isna(turismo_cat) or str(turismo_cat).strip() == '':
-            turismo_cat = '-'
-        else:
-            # Simplificar categoria (pegar apenas primeira parte antes do hífen)
-            turismo_cat = str(turismo_cat).split('-')[0].strip()
+        def aero_col(col):
+            return df_aero[col] if col in df_aero.columns else pd.Series(pd.NA, index=df_aero.index)
         
-        # Aeroportos na UTP
-        aeroportos_info = []
-        for _, mun in group.iterrows():
-            if 'aeroporto' in mun and isinstance(mun['aeroporto'], dict):
-                aero = mun['aeroporto']
-                icao = aero.get('sigla', '') or aero.get('icao', '')
-                passageiros = aero.get('passageiros_anual', 0)
-                
-                if icao and str(icao).strip() not in ['', 'nan', 'None']:
-                    aeroportos_info.append({
-                        'icao': str(icao),
-                        'passageiros': int(passageiros) if passageiros else 0,
-                        'municipio': mun['nm_mun']
-                    })
+        sigla = aero_col('sigla').astype('string').replace('', pd.NA)
+        icao = sigla.fillna(aero_col('icao').astype('string')).str.strip()
+        aeros = pd.DataFrame({
+            'utp_id': df.loc[df_aero.index, 'utp_id'],
+            'icao': icao,
+            'passageiros': pd.to_numeric(aero_col('passageiros_anual'), errors='coerce').fillna(0).astype('int64'),
+        })
+        aeros = aeros[aeros['icao'].notna() & ~aeros['icao'].isin(['', 'nan', 'None'])]
         
-        # Determinar principal aeroporto e formatar
-        if aeroportos_info:
-            # Ordenar por passageiros
-            aeroportos_info.sort(key=lambda x: x['passageiros'], reverse=True)
-            principal = aeroportos_info[0]
+        if not aeros.empty:
+            # Principal aeroporto por passageiros (estável para empates)
+            aeros = aeros.sort_values('passageiros', ascending=False, kind='stable')
+            principal = aeros.drop_duplicates('utp_id').set_index('utp_id')
+            n_aeros = aeros['utp_id'].value_counts().reindex(principal.index)
             
-            # Formatar passageiros
-            if principal['passageiros'] > 1000000:
-                pass_fmt = f"{principal['passageiros']/1000000:.1f}M"
-            elif principal['passageiros'] > 1000:
-                pass_fmt = f"{principal['passageiros']/1000:.0f}k"
-            else:
-                pass_fmt = str(principal['passageiros'])
+            passageiros = principal['passageiros']
+            pass_fmt = pd.Series(np.select(
+                [passageiros > 1000000, passageiros > 1000],
+                [(passageiros / 1000000).map('{:.1f}M'.format), (passageiros / 1000).map('{:.0f}k'.format)],
+                default=passageiros.astype(str),
+            ), index=principal.index)
             
-            if len(aeroportos_info) == 1:
-                aeroporto_display = f"{principal['icao']} ({pass_fmt})"
-            else:
-                aeroporto_display = f"{len(aeroportos_info)} aeros | {principal['icao']} ({pass_fmt})"
-        else:
-            aeroporto_display = '-'
-        
-        # Viagens
-        viagens_total = group['total_viagens'].sum()
-        
-        # Modal dominante da UTP (baseado na sede)
-        modal_dom = sede.get('modal_dominante', '-')
-        
-        # REGIC
-        regic = sede.get('regic', '-')
-        if pd.isna(regic) or str(regic).strip() == '':
-            regic = '-'
-        
-        # Região Metropolitana
-        rm = sede.get('regiao_metropolitana', '')
-        if pd.isna(rm) or str(rm).strip() == '':
-            rm = '-'
-        
-        summary_list.append({
-            'UTP': utp_id,
-            'Sede': sede['nm_mun'],
-            'UF': sede['uf'],
-            'Municípios': len(group),
-            'População': int(pop_total),
-            'Maior Município': maior_mun_nome,
-            'REGIC': regic,
-            'RM': rm,
-            'Turismo': turismo_cat,
-            'Aeroportos': aeroporto_display,
-            'Viagens': int(viagens_total),
-            'Modal': modal_dom if modal_dom else '-'
-        })
+            display = principal['icao'].astype(str) + ' (' + pass_fmt + ')'
+            display = display.where(n_aeros == 1, n_aeros.astype(str) + ' aeros | ' + display)
+            aeroporto_display.update(display)
+            n_aero.update(n_aeros)
     
-    # Criar DataFrame
-    summary_df = pd.DataFrame(summary_list)
+    summary_df = pd.DataFrame({
+        'UTP': agg.index,
+        'Sede': agg['nm_mun'],
+        'UF': agg['uf'],
+        'Municípios': agg['n_mun'],
+        'População': agg['populacao'].astype('int64'),
+        'Maior Município': agg['maior_mun'],
+        'REGIC': sede_text('regic').fillna('-'),
+        'RM': sede_text('regiao_metropolitana').fillna('-'),
+        'Turismo': turismo,
+        'Aeroportos': aeroporto_display,
+        'Viagens': agg['viagens'].astype('int64'),
+        'Modal': agg['modal_dominante'].replace('', '-'),
+        '_n_aero': n_aero
+    }).reset_index(drop=True)
     
     if summary_df.empty:
         return summary_df
@@ -517,14 +716,76 @@ def create_enriched_utp_summary(df_municipios):
     # Ordenar por população (decrescente)
     summary_df = summary_df.sort_values('População', ascending=False)
     
-    # Formatar colunas numéricas para display
-    summary_df_display = summary_df.copy()
-    summary_df_display['População'] = summary_df_display['População'].apply(lambda x: f"{x:,}")
-    summary_df_display['Viagens'] = summary_df_display['Viagens'].apply(
-        lambda x: f"{x:,}" if x > 0 else '-'
+    return summary_df
+
+
+def hash_summary_input(df):
+    """
+    Chave barata para o frame de municípios do resumo: forma, colunas, índice
+    e colunas escalares (os dicts de modais/aeroporto não são hasheáveis).
+    """
+    scalar_cols = [c for c in UTP_SUMMARY_COLS if c in df.columns]
+    return (
+        df.shape,
+        tuple(df.columns),
+        int(pd.util.hash_pandas_object(df.index).sum()),
+        hash_dataframe(df[scalar_cols].astype(str)),
     )
+
+
+@st.cache_data(show_spinner=False, hash_funcs={pd.DataFrame: hash_summary_input})
+def get_enriched_utp_summary(df_municipios):
+    """Versão memoizada de create_enriched_utp_summary (evita recálculo em reruns)."""
+    return create_enriched_utp_summary(df_municipios)
+
+
+@st.cache_data(show_spinner=False, hash_funcs={pd.DataFrame: hash_dataframe})
+def get_utp_population_stats(df_pop):
+    """População total por UTP e sua média/mediana (para as métricas da aba inicial)."""
+    pop_by_utp = df_pop.groupby('utp_id', sort=False, observed=True)['populacao_2022'].sum()
+    return pop_by_utp.mean(), pop_by_utp.median(), pop_by_utp
+
+
+def style_utp_summary(summary_df):
+    """Formata População/Viagens para exibição sem converter as colunas em texto."""
+    return summary_df.drop(columns='_n_aero', errors='ignore').style.format({
+        'População': '{:,}'.format,
+        'Viagens': lambda v: f"{v:,}" if v > 0 else '-'
+    })
+
+
+def attach_municipio_uf(df_snapshot, df_municipios):
+    """
+    Acrescenta a UF de cada município a um frame de snapshot.
+    
+    Os snapshots (SnapshotLoader.get_snapshot_dataframe) não trazem "uf" e
+    guardam cd_mun como texto: a UF vem de df_municipios, casada pelo código.
+    """
+    if 'uf' in df_snapshot.columns:
+        return df_snapshot
+    ufs = df_municipios.drop_duplicates('cd_mun')
+    uf_by_cd = pd.Series(ufs['uf'].to_numpy(), index=ufs['cd_mun'].astype(str))
+    return df_snapshot.assign(uf=df_snapshot['cd_mun'].astype(str).map(uf_by_cd))
+
+
+def render_territory_metrics(frame, total_municipios, total_utps, total_ufs):
+    """
+    Métricas padronizadas (Municípios / UTPs / Estados) de um recorte.
     
-    return summary_df_display
+    Aceita o DataFrame de municípios (cd_mun) ou GeoDataFrames de snapshot
+    (CD_MUN, de tipo variável conforme a fonte, contado como texto).
+    """
+    if 'CD_MUN' in frame.columns:
+        n_municipios = frame['CD_MUN'].astype(str).nunique()
+    else:
+        n_municipios = frame['cd_mun'].nunique()
+    metrics = (
+        ("Municípios", n_municipios, total_municipios),
+        ("UTPs", frame['utp_id'].nunique(), total_utps),
+        ("Estados", frame['uf'].nunique(), total_ufs),
+    )
+    for col, (label, value, total) in zip(st.columns(3), metrics):
+        col.metric(label, value, f"{total} total")
 
 
 def analyze_unitary_utps(df_municipios):
@@ -534,14 +795,14 @@ def analyze_unitary_utps(df_municipios):
     Returns:
         DataFrame com lista de UTPs unitárias e seus detalhes
     """
-    utp_counts = df_municipios.groupby('utp_id').size().reset_index(name='num_municipios')
+    utp_counts = df_municipios.groupby('utp_id', observed=True).size().reset_index(name='num_municipios')
     unitary_utps = utp_counts[utp_counts['num_municipios'] == 1]['utp_id'].tolist()
     
     if not unitary_utps:
         return pd.DataFrame()
     
     # Buscar detalhes dos municípios únicos
-    df_unitary = df_municipios[df_municipios['utp_id'].isin(unitary_utps)].copy()
+    df_unitary = df_municipios[df_municipios['utp_id'].isin(unitary_utps)]
     
     result = df_unitary[['utp_id', 'nm_mun', 'uf', 'populacao_2022', 'regiao_metropolitana']].copy()
     result.columns = ['UTP', 'Município', 'UF', 'População', 'RM']
@@ -555,8 +816,8 @@ def analyze_non_contiguous_utps(gdf):
     """
     Identifica UTPs cujos municípios não são geograficamente contíguos.
     
-    Usa análise espacial para verificar se todos os municípios de uma UTP
-    formam uma região conectada.
+    Consulta todas as adjacências de uma vez numa STRtree e agrupa os
+    municípios de cada UTP em componentes conexos do grafo de vizinhança.
     
     Returns:
         Dict com UTP_ID -> lista de componentes desconectados
@@ -564,51 +825,323 @@ def analyze_non_contiguous_utps(gdf):
     if gdf is None or gdf.empty:
         return {}
     
-    from shapely.ops import unary_union
+    import networkx as nx
+    import shapely
     
     non_contiguous = {}
     
-    # Agrupar por UTP
-    for utp_id, group in gdf.groupby('utp_id'):
-        if len(group) <= 1:
-            continue  # UTP unitária, não há como ser não-contígua
+    try:
+        geoms = gdf.geometry.values
+        utp_ids = gdf['utp_id'].to_numpy()
+        names = gdf['NM_MUN'].to_numpy()
+        
+        # Todos os pares que se tocam, numa única consulta ao índice espacial
+        tree = shapely.STRtree(geoms)
+        left, right = tree.query(geoms, predicate='intersects')
+        keep = (left < right) & (utp_ids[left] == utp_ids[right])
+        left, right = left[keep], right[keep]
         
-        # Criar união das geometrias
+        # Apenas contato por fronteira (linha) ou sobreposição conecta;
+        # toque em um único ponto não une as geometrias
+        a, b = geoms[left], geoms[right]
+        shared = shapely.relate_pattern(a, b, '2********') | shapely.relate_pattern(a, b, '****1****')
+        
+        graph = nx.Graph()
+        graph.add_nodes_from(range(len(gdf)))
+        graph.add_edges_from(zip(left[shared].tolist(), right[shared].tolist()))
+        
+        components_by_utp = {}
+        for component in nx.connected_components(graph):
+            members = sorted(component)
+            components_by_utp.setdefault(utp_ids[members[0]], []).append(names[members].tolist())
+        
+        sizes = gdf['utp_id'].value_counts()
+        for utp_id, components_info in components_by_utp.items():
+            if len(components_info) > 1:
+                non_contiguous[utp_id] = {
+                    'num_components': len(components_info),
+                    'components': components_info,
+                    'num_municipalities': int(sizes[utp_id])
+                }
+    except Exception as e:
+        logging.warning(f"Erro ao analisar contiguidade das UTPs: {e}")
+    
+    return non_contiguous
+
+
+
+
+
+def render_border_rejections(rejections):
+    """Tabela e distribuição de motivos das propostas de realocação rejeitadas."""
+    if rejections:
+        # Preparar dados para tabela
+        rejections_df = (
+            pd.DataFrame.from_records(rejections)
+            .reindex(columns=list(_REJ_COLS))
+            .rename(columns=_REJ_COLS)
+            .fillna({'UTP Proposta': 'N/A', 'Motivo': 'N/A', 'Detalhes': '', 'Iteração': 1})
+            .astype({'Iteração': int, 'Motivo': 'category'})
+        )
+
+        st.markdown(f"**{len(rejections_df)} propostas rejeitadas**")
+
+        # Análise de motivos
+        st.markdown("**Distribuição de Motivos de Rejeição:**")
+        reason_counts = rejections_df['Motivo'].value_counts()
+        reason_df = (
+            reason_counts.rename_axis('Motivo').to_frame('Contagem')
+            .assign(Percentual=lambda d: (d['Contagem'] / d['Contagem'].sum() * 100).round(1))
+            .reset_index()
+        )
+        st.dataframe(reason_df, hide_index=True, width='stretch')
+
+        st.markdown("---")
+        st.markdown("**Detalhes:**")
+        st.dataframe(rejections_df, hide_index=True, width='stretch', height=400)
+    else:
+        st.success("✅ Nenhuma rejeição! Todas as propostas foram aceitas.")
+
+
+@st.fragment
+def render_border_validation_panel(consolidation_loader, gdf):
+    """
+    Painel de resultados da validação de fronteiras (Step 8).
+    
+    Executado como fragmento: interações nos widgets do painel reexecutam
+    apenas este bloco, não o dashboard inteiro.
+    """
+    # Carregar dados de validação de fronteiras
+    borders_json_path = Path(__file__).parent.parent.parent / "data" / "03_processed" / "border_validation_result.json"
+    
+    if borders_json_path.exists():
         try:
-            # Dissolve para criar geometria única da UTP
-            utp_geom = group.geometry.unary_union
+            borders_data = orjson.loads(borders_json_path.read_bytes())
+            
+            metadata = borders_data.get('metadata', {})
+            relocations = borders_data.get('relocations', [])
+            rejections = borders_data.get('rejections', [])
+            transitive_chains = borders_data.get('transitive_chains', [])
+            
+            # === MÉTRICAS PADRONIZADAS (REMOVIDO DAQUI) ===
+            # (Movido para cima do mapa)
             
-            # Verificar se é MultiPolygon (indica descontinuidade)
-            if utp_geom.geom_type == 'MultiPolygon':
-                # Contar componentes desconectados
-                num_components = len(utp_geom.geoms)
+            st.markdown("---")
+            
+            # === CADEIAS TRANSITIVAS ===
+            if transitive_chains:
+                st.markdown("#### 🔗 Cadeias Transitivas Detectadas")
+                st.caption(f"{len(transitive_chains)} cadeia(s) transitiva(s) resolvida(s)")
                 
-                # Identificar quais municípios estão em cada componente
-                components_info = []
-                for i, component in enumerate(utp_geom.geoms):
-                    # Encontrar municípios que intersectam este componente
-                    municipalities_in_component = []
-                    for idx, row in group.iterrows():
-                        if row.geometry.intersects(component):
-                            municipalities_in_component.append(row['NM_MUN'])
-                    
-                    if municipalities_in_component:
-                        components_info.append(municipalities_in_component)
+                for i, chain in enumerate(transitive_chains, 1):
+                    chain_str = " → ".join(chain['chain'])
+                    final_utp = chain['final_utp']
+                    st.info(f"**Cadeia {i}:** {chain_str} → **UTP {final_utp}**")
                 
-                if num_components > 1:
-                    non_contiguous[utp_id] = {
-                        'num_components': num_components,
-                        'components': components_info,
-                        'num_municipalities': len(group)
-                    }
-        except Exception as e:
-            logging.warning(f"Erro ao analisar contiguidade da UTP {utp_id}: {e}")
-            continue
-    
-    return non_contiguous
-
+                st.markdown("---")
+            
+            # === TABS INTERNAS: REALOCAÇÕES VS REJEIÇÕES ===
+            # Tabs com estado: só a aba selecionada é executada (".open")
+            subtab1, subtab2 = st.tabs(["Realocações", "Rejeições"], key='border_subtabs', on_change="rerun")
+            
+            with subtab1:
+                st.markdown("#### Municípios Realocados")
+                
+                if subtab1.open:
+                    if relocations:
+                        # Preparar dados para tabela (Usando lista atual)
+                        relocations_df = (
+                            pd.DataFrame.from_records(relocations)
+                            .reindex(columns=list(_REL_COLS))
+                            .rename(columns=_REL_COLS)
+                            .fillna({'Iteração': 1, 'Motivo': 'N/A'})
+                            .astype({'Iteração': int})
+                        )
+                    else:
+                        # Tentar carregar HISTÓRICO da ConsolidationManager se a lista atual estiver vazia
+                        # Isso garante que a tabela mostre o histórico mesmo se a última execução foi limpa
+                
+                        history_consolidations = consolidation_loader.get_consolidations()
+                
+                        # Achatar 'details' em colunas e classificar os registros de validação
+                        # de fronteira com máscaras vetorizadas (pelo "reason" ou "details.step")
+                        hist_df = pd.json_normalize(history_consolidations).reindex(columns=[
+                            'reason', 'source_utp', 'target_utp', 'details.step',
+                            'details.municipality_id', 'details.municipality_name', 'details.iteration'
+                        ])
+                        hist_reasons = hist_df['reason'].astype('string').fillna('')
+                        hist_steps = hist_df['details.step'].astype('string')
+                        border_mask = (
+                            hist_reasons.str.contains('Border validation', regex=False)
+                            | hist_steps.eq('border_validation').fillna(False)
+                        ).astype(bool)
+                        hist_border = hist_df[border_mask]
+                        mun_ids = pd.to_numeric(hist_border['details.municipality_id'], errors='coerce')
+                        border_history = pd.DataFrame({
+                            "Município": hist_border['details.municipality_name'].fillna(
+                                mun_ids.astype('Int64').astype('string').fillna('Unknown')
+                            ),
+                            "CD_MUN": mun_ids.fillna(0).astype('int64'),
+                            "UTP Origem": hist_border['source_utp'],
+                            "UTP Destino": hist_border['target_utp'],
+                            "Iteração": hist_border['details.iteration'].fillna(1).astype(int),
+                            "Motivo": hist_reasons[border_mask]
+                        })
+                
+                        if not border_history.empty:
+                            relocations_df = border_history
+                            st.info(f"Mostrando histórico acumulado de {len(relocations_df)} realocações (execuções anteriores)")
+                        else:
+                            relocations_df = pd.DataFrame()
 
+                    # Só renderizar se tiver dados (seja atual ou histórico)
+                    if not relocations_df.empty:
+                        # Colunas de baixa cardinalidade: contagens sobre códigos inteiros
+                        for c in ('UTP Origem', 'UTP Destino', 'Motivo'):
+                            relocations_df[c] = relocations_df[c].astype('category')
+                    
+                        # Estatísticas
+                        st.markdown(f"**{len(relocations_df)} municípios realocados**")
+                    
+                        col1, col2 = st.columns(2)
+                        with col1:
+                            st.metric("UTPs Origem Únicas", relocations_df['UTP Origem'].nunique())
+                        with col2:
+                            st.metric("UTPs Destino Únicas", relocations_df['UTP Destino'].nunique())
+                
+                        # Distribuição por iteração
+                        st.markdown("**Distribuição por Iteração:**")
+                        iter_counts = relocations_df['Iteração'].value_counts().sort_index()
+                        st.dataframe(
+                            iter_counts.rename_axis('Iteração').reset_index(name='Realocações'),
+                            hide_index=True
+                        )
+                
+                        st.markdown("---")
+                        st.markdown("**Detalhes:**")
+                        st.dataframe(relocations_df, hide_index=True, width='stretch', height=400)
+                
+                        # Visualização no mapa
+                        if gdf is not None:
+                            st.markdown("---")
+                            st.markdown("#### Mapa de Municípios Realocados")
+                    
+                            # Destacar municípios realocados
+                            # Precisamos extrair IDs da tabela consolidada
+                            if 'CD_MUN' in relocations_df.columns:
+                                 # CD_MUN no gdf é string (normalizado em get_geodataframe)
+                                 relocated_ids = np.unique(relocations_df['CD_MUN'].astype(str).to_numpy())
+                         
+                                 # Reconstruir o mapa apenas quando o conjunto de realocados mudar
+                                 # np.unique devolve os ids ordenados: a tupla é uma chave estável
+                                 reloc_map_key = hash(tuple(relocated_ids))
+                                 if st.session_state.get('_reloc_map_key') != reloc_map_key:
+                                     gdf_indexed = get_gdf_by_cd_mun(gdf.attrs.get('cache_key'), gdf)
+                                     valid_ids = gdf_indexed.index.intersection(relocated_ids)
+                                     gdf_highlight = gdf_indexed.loc[valid_ids]
+                                     # Simplificação leve e coordenadas arredondadas para reduzir o GeoJSON emitido pelo folium
+                                     gdf_highlight['geometry'] = simplify_for_display(gdf_highlight.geometry.values, 0.003)
+                                     # Serializar apenas os campos do tooltip, em strings Arrow
+                                     tooltip_fields = ['NM_MUN', 'utp_id', 'uf']
+                                     gdf_highlight = gdf_highlight[tooltip_fields + ['geometry']]
+                                     for c in tooltip_fields:
+                                         gdf_highlight[c] = gdf_highlight[c].astype('string[pyarrow]')
+                                     reloc_map_html = None
+                             
+                                     if not gdf_highlight.empty:
+                                         import folium
+                                 
+                                         # Criar mapa básico
+                                         m = folium.Map(
+                                             location=[-15, -55],
+                                             zoom_start=4,
+                                             tiles="CartoDB positron"
+                                         )
+                                 
+                                         # Adicionar municípios realocados em destaque
+                                         folium.GeoJson(
+                                             gdf_highlight.to_geo_dict(),
+                                             style_function=lambda x: {
+                                                 'fillColor': '#FF6B6B',
+                                                 'color': '#C92A2A',
+                                                 'weight': 2,
+                                                 'fillOpacity': 0.7
+                                             },
+                                             tooltip=folium.GeoJsonTooltip(
+                                                 fields=tooltip_fields,
+                                                 aliases=['Município:', 'UTP:', 'UF:']
+                                             )
+                                         ).add_to(m)
+                                 
+                                         # Fit bounds
+                                         bounds = gdf_highlight.total_bounds
+                                         m.fit_bounds([[bounds[1], bounds[0]], [bounds[3], bounds[2]]])
+                                 
+                                         reloc_map_html = m._repr_html_()
+                             
+                                     st.session_state['_reloc_map_html'] = reloc_map_html
+                                     st.session_state['_reloc_map_count'] = len(gdf_highlight)
+                                     st.session_state['_reloc_map_key'] = reloc_map_key
+                         
+                                 if st.session_state['_reloc_map_html']:
+                                     st.caption(f"Destacando {st.session_state['_reloc_map_count']} municípios realocados")
+                                     st.components.v1.html(st.session_state['_reloc_map_html'], height=500, scrolling=False)
 
+                    else:
+                        if not relocations and not 'border_history' in locals():
+                             st.info("Nenhuma realocação foi realizada.")
+                             st.caption("Todas as fronteiras já estão otimizadas!")
+            
+            with subtab2:
+                st.markdown("#### Propostas de Realocação Rejeitadas")
+                
+                if subtab2.open:
+                    render_border_rejections(rejections)
+            
+            # === DOWNLOAD ===
+            st.markdown("---")
+            col1, col2 = st.columns(2)
+            
+            with col1:
+                # Download JSON (bytes do próprio artefato, cacheados por versão do arquivo;
+                # lidos só no clique, como o CSV)
+                borders_json_mtime = borders_json_path.stat().st_mtime
+                st.download_button(
+                    label="Baixar Resultados (JSON)",
+                    data=lambda: get_file_bytes(str(borders_json_path), borders_json_mtime),
+                    file_name=f"border_validation_{get_export_timestamp()}.json",
+                    mime="application/json"
+                )
+            
+            with col2:
+                # Download CSV
+                csv_path = Path(__file__).parent.parent.parent / "data" / "03_processed" / "border_validation_result.csv"
+                if csv_path.exists():
+                    # Bytes crus (com BOM) vão direto para o download, sem decodificar.
+                    # data é um callable: o arquivo só é lido quando o usuário clica
+                    csv_mtime = csv_path.stat().st_mtime
+                    st.download_button(
+                        label="Baixar Resultados (CSV)",
+                        data=lambda: get_file_bytes(str(csv_path), csv_mtime),
+                        file_name=f"border_validation_{get_export_timestamp()}.csv",
+                        mime="text/csv"
+                    )
+            
+        except Exception as e:
+            st.error(f"Erro ao carregar dados de validação de fronteiras: {e}")
+            import traceback
+            st.code(traceback.format_exc())
+    else:
+        st.warning("⚠️ Dados de validação de fronteiras não encontrados")
+        st.info("""
+        **Como gerar os dados:**
+        1. Execute o pipeline completo: `python main.py`
+        2. Ou execute apenas a consolidação: `python src/run_consolidation.py`
+        
+        O Step 8 (Validação de Fronteiras) será executado automaticamente e gerará os arquivos:
+        - `data/03_processed/border_validation_result.json`
+        - `data/03_processed/border_validation_result.csv`
+        """)
 
 
 def render_dashboard(manager):
@@ -644,11 +1177,14 @@ def render_dashboard(manager):
             return
         
         # Garantir types consistentes
+        # utp_id (~600 valores) e uf (27) como category: isin/groupby/nunique
+        # operam sobre os códigos inteiros
         if 'utp_id' in df_municipios.columns:
-            df_municipios['utp_id'] = df_municipios['utp_id'].astype(str)
+            df_municipios['utp_id'] = df_municipios['utp_id'].astype(str).astype('category')
+        df_municipios['uf'] = df_municipios['uf'].astype('category')
         
-        # Filtro por UF
-        ufs = sorted(df_municipios['uf'].unique().tolist())
+        # Filtro por UF (categorias já ordenadas)
+        ufs = df_municipios['uf'].cat.categories.tolist()
         all_ufs = st.checkbox("Brasil Completo", value=True)
         
         if all_ufs:
@@ -660,7 +1196,7 @@ def render_dashboard(manager):
         # Filtro por Município (Novo)
         st.markdown("---")
         # Criar lista formatada "Nome (UF)"
-        df_municipios['display_name'] = df_municipios['nm_mun'] + " (" + df_municipios['uf'] + ")"
+        df_municipios['display_name'] = df_municipios['nm_mun'] + " (" + df_municipios['uf'].astype(str) + ")"
         mun_options = sorted(df_municipios['display_name'].unique().tolist())
         
         selected_muns_search = st.multiselect(
@@ -685,8 +1221,11 @@ def render_dashboard(manager):
                 st.info(f"Visualizando {len(forced_utps_from_search)} UTP(s) referente(s) à busca.")
         
         # Filtro por UTP (Mantido, mas com lógica condicional)
-        if selected_ufs:
-            df_utp_options = df_municipios[df_municipios['uf'].isin(selected_ufs)]
+        # A máscara de UF é calculada uma vez e reaproveitada no filtro final;
+        # com "Brasil Completo" não há máscara (nenhum isin sobre o frame)
+        uf_mask = None if all_ufs else df_municipios['uf'].isin(selected_ufs)
+        if selected_ufs and not all_ufs:
+            df_utp_options = df_municipios[uf_mask]
         else:
             df_utp_options = df_municipios
             
@@ -706,18 +1245,35 @@ def render_dashboard(manager):
         
 
     
-    # Aplicar filtros
-    # Aplicar filtros
-    df_filtered = df_municipios[df_municipios['uf'].isin(selected_ufs)].copy()
-    
+    # Aplicar filtros (uma única máscara booleana sobre df_municipios)
     # Lógica de prioridade: Busca por Município > Filtro de UTP
+    # "Todas as UTPs" já está contido no recorte de UF: só filtra se houver seleção manual
+    utp_filter = frozenset(selected_utps) if selected_utps and not all_utps else None
     if forced_utps_from_search:
         # Se buscou município, ignora o filtro de UTP manual e mostra as UTPs da busca
         # Mas mantemos o filtro de UF? Geralmente user quer ver o resultado da busca independente da UF
         # Vamos priorizar a busca globalmente
-        df_filtered = df_municipios[df_municipios['utp_id'].isin(forced_utps_from_search)].copy()
-    elif selected_utps:
-        df_filtered = df_filtered[df_filtered['utp_id'].isin(selected_utps)]
+        filter_mask = df_municipios['utp_id'].isin(forced_utps_from_search)
+    elif uf_mask is None and utp_filter is None:
+        # Brasil Completo sem recorte de UTP: reaproveita df_municipios (sem máscara)
+        filter_mask = None
+    elif uf_mask is None:
+        filter_mask = df_municipios['utp_id'].isin(utp_filter)
+    else:
+        filter_mask = uf_mask
+        if utp_filter is not None:
+            filter_mask = filter_mask & df_municipios['utp_id'].isin(utp_filter)
+    # Total de municípios (constante entre abas): contado uma vez por rerun
+    total_municipios = len(df_municipios['cd_mun'].unique())
+    
+    # Sem filtro efetivo (todas as UFs, sem recorte de UTP) reaproveita df_municipios
+    if filter_mask is None or filter_mask.all():
+        df_filtered = df_municipios
+    else:
+        df_filtered = df_municipios[filter_mask]
+    # Códigos visíveis no formato dos snapshots (cd_mun como texto);
+    # None quando não há filtro efetivo e os snapshots valem inteiros
+    filtered_cd_mun = None if df_filtered is df_municipios else df_filtered['cd_mun'].astype(str)
     
     
     # Carregar GeoDataFrames otimizados (gerados pelo pipeline main.py)
@@ -725,7 +1281,14 @@ def render_dashboard(manager):
     optimized_municipalities_path = maps_dir / "municipalities_optimized.geojson"
     optimized_rm_path = maps_dir / "rm_boundaries_optimized.geojson"
     
-    gdf = get_geodataframe(optimized_municipalities_path, df_municipios)
+    geo_data_key = (
+        optimized_municipalities_path.stat().st_mtime_ns if optimized_municipalities_path.exists() else None,
+        df_municipios.shape[0]
+    )
+    gdf = get_geodataframe(optimized_municipalities_path, geo_data_key, df_municipios[GEO_ATTR_COLS])
+    gdf_token = gdf.attrs.get('cache_key') if gdf is not None else None
+    ufs_key = None if all_ufs else tuple(sorted(selected_ufs))
+    utps_key = tuple(sorted(utp_filter)) if utp_filter is not None else ()
     gdf_rm = get_derived_rm_geodataframe(optimized_rm_path)
     
     # Carregar Estados otimizados
@@ -733,20 +1296,13 @@ def render_dashboard(manager):
     gdf_states_optimized = get_derived_state_geodataframe(optimized_state_path)
 
     
-    # 1. Preparar DataFrame limpo para o grafo (sem dicts para evitar erro de hash)
-    # Selecionamos apenas as colunas necessárias para a estrutura topológica
-    topology_cols = ['cd_mun', 'nm_mun', 'utp_id', 'regiao_metropolitana']
-    df_topology = df_municipios[topology_cols].copy()
-    
-    # Criar e cachear grafo territorial usando o DF limpo
-    graph = get_territorial_graph(df_topology)
-    
-    # 2. Carregar ou calcular coloração GLOBAL (Persistente em arquivo)
+    # Carregar ou calcular coloração GLOBAL (Persistente em arquivo)
     # ATENÇÃO: Carregamos aqui a INITIAL por padrão, mas cada tab pode pedir a sua
     global_colors_initial = load_or_compute_coloring(gdf, "initial_coloring.json") if gdf is not None else {}
     
     # === TABS ===
-    # === TABS ===
+    # Tabs 1-3 são fragments: widgets internos (contornos, filtros locais) só
+    # reexecutam a própria aba, não o script inteiro
     tab1, tab2, tab3, tab4 = st.tabs([
         "Versão 8.0 - Distribuição Inicial",
         "Versão 8.1 - UTPs unitárias",
@@ -756,337 +1312,333 @@ def render_dashboard(manager):
     
     # ==== TAB 1: DISTRIBUIÇÃO INICIAL ====
     with tab1:
-        st.markdown("### <span class='step-badge step-initial'>Versão 8.0</span> Distribuição Inicial", unsafe_allow_html=True)
-        st.markdown("""
-        **Antes da v8, o maior desafio era a integridade referencial. Com base no estudo da versão 7, foi possível efetuar as seguintes melhorias**
+        @st.fragment
+        def render_tab1():
+            st.markdown("### <span class='step-badge step-initial'>Versão 8.0</span> Distribuição Inicial", unsafe_allow_html=True)
+            st.markdown("""
+            **Antes da v8, o maior desafio era a integridade referencial. Com base no estudo da versão 7, foi possível efetuar as seguintes melhorias**
         
-        *   **Continuidade:** 3 UTPs não possuíram municípios conexos territorialmente, totalizando 24 municípios.
-        *   **Região Metropolitana:** 169 UTPs apresentavam discrepância entre as regiões metropolitanas, totalizando 2154 municípios.
+            *   **Continuidade:** 3 UTPs não possuíram municípios conexos territorialmente, totalizando 24 municípios.
+            *   **Região Metropolitana:** 169 UTPs apresentavam discrepância entre as regiões metropolitanas, totalizando 2154 municípios.
         
-        *Esta é configuração inicial considerada pela ferramenta, para as demais consolidações de versões.*
-        """)
-        st.markdown("---")
+            *Esta é configuração inicial considerada pela ferramenta, para as demais consolidações de versões.*
+            """)
+            st.markdown("---")
         
-        col1, col2, col3 = st.columns(3)
-        with col1:
-            # Usar contagem única de CDs para evitar contar shapefiles duplicados
-            total_unique = df_municipios['cd_mun'].nunique()
-            current_unique = df_filtered['cd_mun'].nunique()
-            st.metric("Municípios", current_unique, f"{total_unique} total")
-        with col2:
-            st.metric("UTPs", len(df_filtered['utp_id'].unique()), f"{len(utps_list)} total")
-        with col3:
-            st.metric("Estados", len(df_filtered['uf'].unique()), f"{len(ufs)} total")
+            # Contagem única de CDs para evitar contar shapefiles duplicados
+            render_territory_metrics(df_filtered, total_municipios, len(utps_list), len(ufs))
         
-        st.markdown("---")
-        st.markdown("#### Mapa Interativo")
+            st.markdown("---")
+            st.markdown("#### Mapa Interativo")
         
-        # Controle de visualização de contornos
-        col_ctrl1, col_ctrl2 = st.columns(2)
-        with col_ctrl1:
-            show_rm_borders = st.checkbox(
-                "Mostrar contornos de Regiões Metropolitanas",
-                value=False,
-                key='show_rm_tab1',
-                help="Ativa/desativa a visualização dos contornos das Regiões Metropolitanas"
-            )
-        with col_ctrl2:
-            show_state_borders = st.checkbox(
-                "Mostrar limites Estaduais",
-                value=False,
-                key='show_state_tab1',
-                help="Ativa/desativa a visualização dos limites dos Estados"
-            )
+            # Controle de visualização de contornos
+            col_ctrl1, col_ctrl2 = st.columns(2)
+            with col_ctrl1:
+                show_rm_borders = st.checkbox(
+                    "Mostrar contornos de Regiões Metropolitanas",
+                    value=False,
+                    key='show_rm_tab1',
+                    help="Ativa/desativa a visualização dos contornos das Regiões Metropolitanas"
+                )
+            with col_ctrl2:
+                show_state_borders = st.checkbox(
+                    "Mostrar limites Estaduais",
+                    value=False,
+                    key='show_state_tab1',
+                    help="Ativa/desativa a visualização dos limites dos Estados"
+                )
         
-        # Tentar carregar snapshot do estado inicial (Step 1)
-        # Se não existir, usa o gdf base (que já é o inicial carregado dos inputs)
-        gdf_initial = snapshot_loader.get_geodataframe_for_step('step1', gdf)
-        gdf_display = gdf_initial if gdf_initial is not None else gdf
-
-        if gdf_display is not None:
-            gdf_filtered = gdf_display[gdf_display['uf'].isin(selected_ufs)].copy()
-            if selected_utps:
-                gdf_filtered = gdf_filtered[gdf_filtered['utp_id'].isin(selected_utps)]
+            # Tentar carregar snapshot do estado inicial (Step 1)
+            # Se não existir, usa o gdf base (que já é o inicial carregado dos inputs)
+            gdf_initial = snapshot_loader.get_geodataframe_for_step('step1', gdf)
+            gdf_display = gdf_initial if gdf_initial is not None else gdf
+
+            if gdf_display is not None:
+                display_token = ('step1', snapshot_loader.get_mtime('step1'), gdf_token) if gdf_initial is not None else gdf_token
+                gdf_filtered = filter_gdf(display_token, ufs_key, utps_key, gdf_display)
             
-            # Preparar contornos de estado (filtrado pelos estados selecionados)
-            gdf_states_filtered = None
-            if show_state_borders:
-                # 1. Tentar usar otimizado
-                if gdf_states_optimized is not None:
-                    gdf_all_states = gdf_states_optimized
-                # 2. Fallback: calcular do GDF atual
-                elif gdf is not None:
-                    gdf_all_states = get_state_boundaries(gdf)
-                else:
-                    gdf_all_states = None
-                    
-                if gdf_all_states is not None:
-                    # Filtrar apenas estados selecionados ou visíveis no filtro atual
-                    if selected_ufs:
-                        gdf_states_filtered = gdf_all_states[gdf_all_states['uf'].isin(selected_ufs)]
+                # Preparar contornos de estado (filtrado pelos estados selecionados)
+                gdf_states_filtered = None
+                if show_state_borders:
+                    # 1. Tentar usar otimizado
+                    if gdf_states_optimized is not None:
+                        gdf_all_states = gdf_states_optimized
+                    # 2. Fallback: calcular do GDF atual
+                    elif gdf is not None:
+                        gdf_all_states = get_state_boundaries(gdf_token, gdf)
                     else:
-                        gdf_states_filtered = gdf_all_states
-
-            # Renderizar mapa usando render_map_with_flow_popups
-            m = render_map_with_flow_popups(
-                gdf_filtered, 
-                df_municipios, 
-                title="Distribuição por UTP (Inicial)", 
-                global_colors=global_colors_initial, 
-                gdf_rm=gdf_rm, 
-                show_rm_borders=show_rm_borders,
-                show_state_borders=show_state_borders,
-                gdf_states=gdf_states_filtered,
-                PASTEL_PALETTE=PASTEL_PALETTE,
-                step_key='step1'
-            )
-            if m:
-                map_html = m._repr_html_()
-                st.components.v1.html(map_html, height=600, scrolling=False)
+                        gdf_all_states = None
+                    
+                    if gdf_all_states is not None:
+                        # Filtrar apenas estados selecionados ou visíveis no filtro atual
+                        if selected_ufs:
+                            gdf_states_filtered = gdf_all_states[gdf_all_states['uf'].isin(selected_ufs)]
+                        else:
+                            gdf_states_filtered = gdf_all_states
+
+                # Renderizar mapa usando render_map_with_flow_popups
+                map_html = get_map_html(
+                    'step1',
+                    get_map_signature(gdf_filtered),
+                    tuple(selected_ufs),
+                    show_rm_borders,
+                    show_state_borders,
+                    gdf_filtered,
+                    df_municipios,
+                    dict(
+                        title="Distribuição por UTP (Inicial)",
+                        global_colors=global_colors_initial,
+                        gdf_rm=gdf_rm,
+                        gdf_states=gdf_states_filtered,
+                        PASTEL_PALETTE=PASTEL_PALETTE,
+                        raster_threshold=MAP_RASTER_THRESHOLD
+                    )
+                )
+                if map_html:
+                    if len(gdf_filtered) > MAP_RASTER_THRESHOLD:
+                        st.caption("Visão agregada (imagem). Filtre por UF ou UTP para ver os popups de fluxo.")
+                    st.components.v1.html(map_html, height=600, scrolling=False)
         
-        st.markdown("---")
-        st.markdown("#### Configuração Territorial")
-        st.caption("UTPs, sedes e municípios conforme o snapshot desta versão (v8.0 – inicial)")
-        _allowed_muns_tab1 = set(df_filtered['cd_mun'].astype(str).tolist()) if not df_filtered.empty else None
-        df_config_tab1 = render_territorial_config_table('step1', snapshot_loader, _allowed_muns_tab1)
-        if not df_config_tab1.empty:
-            st.dataframe(df_config_tab1, hide_index=True, use_container_width=True, height=400)
-        else:
-            st.info("Snapshot da versão inicial não encontrado. Execute o pipeline completo.")
+            st.markdown("---")
+            st.markdown("#### Configuração Territorial")
+            st.caption("UTPs, sedes e municípios conforme o snapshot desta versão (v8.0 – inicial)")
+            _allowed_muns_tab1 = df_filtered['cd_mun'].unique() if not df_filtered.empty else None
+            df_config_tab1 = get_territorial_config_table('step1', snapshot_loader.get_mtime('step1'), _allowed_muns_tab1, snapshot_loader)
+            if not df_config_tab1.empty:
+                st.dataframe(df_config_tab1, hide_index=True, use_container_width=True, height=400)
+            else:
+                st.info("Snapshot da versão inicial não encontrado. Execute o pipeline completo.")
         
-        st.markdown("---")
-        st.markdown("#### Resumo das UTPs")
-        st.caption("Características socioeconômicas e territoriais agregadas por UTP")
+            st.markdown("---")
+            st.markdown("#### Resumo das UTPs")
+            st.caption("Características socioeconômicas e territoriais agregadas por UTP")
         
-        # Criar resumo enriquecido
-        utp_summary = create_enriched_utp_summary(df_filtered)
+            # Criar resumo enriquecido
+            utp_summary = get_enriched_utp_summary(df_filtered)
         
-        if not utp_summary.empty:
-            st.markdown(f"**{len(utp_summary)} UTPs (ordenadas por população)**")
+            if not utp_summary.empty:
+                st.markdown(f"**{len(utp_summary)} UTPs (ordenadas por população)**")
             
-            # Mostrar todas as UTPs
-            st.dataframe(
-                utp_summary,
-                width='stretch',
-                hide_index=True,
-                height=600
-            )
+                # Mostrar todas as UTPs
+                st.dataframe(
+                    style_utp_summary(utp_summary),
+                    width='stretch',
+                    hide_index=True,
+                    height=600
+                )
             
-            # Estatísticas rápidas
-            st.markdown("---")
-            col1, col2, col3, col4 = st.columns(4)
+                # Estatísticas rápidas
+                st.markdown("---")
+                col1, col2, col3, col4 = st.columns(4)
             
-            # Converter população de volta para número para estatísticas
-            pop_values = df_filtered.groupby('utp_id')['populacao_2022'].sum()
+                pop_mean, pop_median, _ = get_utp_population_stats(df_filtered[['utp_id', 'populacao_2022']])
             
-            with col1:
-                st.metric("População Média", f"{pop_values.mean():,.0f}")
-            with col2:
-                st.metric("População Mediana", f"{pop_values.median():,.0f}")
-            with col3:
-                utps_com_aero = (utp_summary['Aeroportos'] != '-').sum()
-                st.metric("UTPs com Aeroporto", utps_com_aero)
-            with col4:
-                # Contar total de aeroportos
-                total_aeros = 0
-                for val in utp_summary['Aeroportos']:
-                    if val != '-':
-                        if 'aeros' in val:
-                            # Extrair número antes de 'aeros'
-                            total_aeros += int(val.split(' ')[0])
-                        else:
-                            total_aeros += 1
-                st.metric("Total de Aeroportos", total_aeros)
-        else:
-            st.info("Nenhuma UTP encontrada com os filtros selecionados.")
+                with col1:
+                    st.metric("População Média", f"{pop_mean:,.0f}")
+                with col2:
+                    st.metric("População Mediana", f"{pop_median:,.0f}")
+                with col3:
+                    utps_com_aero = int((utp_summary['_n_aero'] > 0).sum())
+                    st.metric("UTPs com Aeroporto", utps_com_aero)
+                with col4:
+                    total_aeros = int(utp_summary['_n_aero'].sum())
+                    st.metric("Total de Aeroportos", total_aeros)
+            else:
+                st.info("Nenhuma UTP encontrada com os filtros selecionados.")
+        render_tab1()
 
 
     
     # ==== TAB 2: PÓS-CONSOLIDAÇÃO ====
     with tab2:
-        st.markdown("### <span class='step-badge step-final'>Versão 8.1</span> UTPs unitárias", unsafe_allow_html=True)
-        st.markdown("""
-        **O objetivo central é garantir que nenhum município permaneça isolado em uma UTP própria, a menos que não haja candidatos adjacentes válidos. O processo segue uma hierarquia de critérios:**
+        @st.fragment
+        def render_tab2():
+            st.markdown("### <span class='step-badge step-final'>Versão 8.1</span> UTPs unitárias", unsafe_allow_html=True)
+            st.markdown("""
+            **O objetivo central é garantir que nenhum município permaneça isolado em uma UTP própria, a menos que não haja candidatos adjacentes válidos. O processo segue uma hierarquia de critérios:**
         
-        1.  **Consolidação Funcional Orientada a Fluxos:** esta etapa utiliza a matriz OD para mover a UTP unitária para uma UTP vizinha com a qual possua maior iteração.
-        2.  **Consolidação Territorial de Último Recurso:** após as tentativas baseadas em fluxos, as UTPs unitárias remanescentes são resolvidas via REGIC com a UTP vizinha de maior importância.
-        """)
-        # === MÉTRICAS PADRONIZADAS (sempre visíveis) ===
-        # Verifica diretamente o snapshot step5 — independente do consolidation_result.json
-        _df_metrics_tab2 = snapshot_loader.get_snapshot_dataframe('step5')
-        if not _df_metrics_tab2.empty and selected_ufs:
-            _df_metrics_tab2 = _df_metrics_tab2[
-                _df_metrics_tab2['cd_mun'].isin(df_filtered['cd_mun'])
-            ].copy()
-
-        if not _df_metrics_tab2.empty:
-            _src_label = "v8.1 – pós consolidação de unitárias"
-            _df_m = _df_metrics_tab2
-        else:
-            _src_label = "v8.0 – distribuição inicial (snapshot v8.1 não encontrado)"
-            _df_m = df_filtered
-
-        col1, col2, col3 = st.columns(3)
-        with col1:
-            st.metric("Municípios", _df_m['cd_mun'].nunique(), f"{df_municipios['cd_mun'].nunique()} total")
-        with col2:
-            st.metric("UTPs", _df_m['utp_id'].nunique(), f"{len(utps_list)} total")
-        with col3:
-            st.metric("Estados", _df_m['uf'].nunique(), f"{len(ufs)} total")
-        st.caption(f"📊 Dados: {_src_label}")
+            1.  **Consolidação Funcional Orientada a Fluxos:** esta etapa utiliza a matriz OD para mover a UTP unitária para uma UTP vizinha com a qual possua maior iteração.
+            2.  **Consolidação Territorial de Último Recurso:** após as tentativas baseadas em fluxos, as UTPs unitárias remanescentes são resolvidas via REGIC com a UTP vizinha de maior importância.
+            """)
+            # === MÉTRICAS PADRONIZADAS (sempre visíveis) ===
+            # Verifica diretamente o snapshot step5 — independente do consolidation_result.json
+            _df_metrics_tab2 = snapshot_loader.get_snapshot_dataframe('step5')
+            if not _df_metrics_tab2.empty and filtered_cd_mun is not None:
+                _df_metrics_tab2 = _df_metrics_tab2[
+                    _df_metrics_tab2['cd_mun'].isin(filtered_cd_mun)
+                ]
+
+            if not _df_metrics_tab2.empty:
+                _src_label = "v8.1 – pós consolidação de unitárias"
+                _df_m = attach_municipio_uf(_df_metrics_tab2, df_municipios)
+            else:
+                _src_label = "v8.0 – distribuição inicial (snapshot v8.1 não encontrado)"
+                _df_m = df_filtered
 
-        st.markdown("---")
+            render_territory_metrics(_df_m, total_municipios, len(utps_list), len(ufs))
+            st.caption(f"📊 Dados: {_src_label}")
 
+            st.markdown("---")
 
-        if consolidation_loader.is_executed():
-            # IMPORTANTE: Usar snapshot pós-unitárias (Steps 5+7) ao invés do resultado completo
-            # Isso garante que as consolidações de sedes NÃO apareçam nesta aba
-            post_unitary_consolidations = consolidation_loader.get_post_unitary_consolidations()
-            post_unitary_mapping = consolidation_loader.get_post_unitary_mapping()
+
+            if consolidation_loader.is_executed():
+                # IMPORTANTE: Usar snapshot pós-unitárias (Steps 5+7) ao invés do resultado completo
+                # Isso garante que as consolidações de sedes NÃO apareçam nesta aba
+                post_unitary_consolidations = consolidation_loader.get_post_unitary_consolidations()
+                post_unitary_mapping = consolidation_loader.get_post_unitary_mapping()
             
-            # Calcular estatísticas baseadas no snapshot pós-unitárias
-            # MUDANÇA CRÍTICA: Usar Snapshot Step 5 (Post-Unitary) direto
-            # Isso garante que vemos exatamente o que foi salvo
-            df_consolidated = snapshot_loader.get_snapshot_dataframe('step5')
-            if df_consolidated.empty:
-                # Fallback se snapshot nao existir (ainda nao rodou pipeline novo)
-                df_consolidated = consolidation_loader.apply_post_unitary_to_dataframe(df_filtered)
-            else:
-                # Filtrar DF do snapshot pelos filtros da UI se necessario (ex: UFs)
-                if selected_ufs:
-                     df_consolidated = df_consolidated[df_consolidated['cd_mun'].isin(df_filtered['cd_mun'])].copy()
+                # Calcular estatísticas baseadas no snapshot pós-unitárias
+                # MUDANÇA CRÍTICA: Usar Snapshot Step 5 (Post-Unitary) direto
+                # Isso garante que vemos exatamente o que foi salvo
+                df_consolidated = snapshot_loader.get_snapshot_dataframe('step5')
+                if df_consolidated.empty:
+                    # Fallback se snapshot nao existir (ainda nao rodou pipeline novo)
+                    df_consolidated = consolidation_loader.apply_post_unitary_to_dataframe(df_filtered)
+                else:
+                    # Filtrar DF do snapshot pelos filtros da UI se necessario (ex: UFs)
+                    if filtered_cd_mun is not None:
+                         df_consolidated = df_consolidated[df_consolidated['cd_mun'].isin(filtered_cd_mun)]
             
-            st.markdown("---")
-            st.markdown("#### Mapa Pós-Consolidação")
+                st.markdown("---")
+                st.markdown("#### Mapa Pós-Consolidação")
             
-            # Controle de visualização de contornos de RM
-            col_ctrl1, col_ctrl2 = st.columns(2)
-            with col_ctrl1:
-                show_rm_borders_tab2 = st.checkbox(
-                    "Mostrar contornos de Regiões Metropolitanas",
-                    value=False,
-                    key='show_rm_tab2',
-                    help="Ativa/desativa a visualização dos contornos das RMs"
-                )
-            with col_ctrl2:
-                show_state_borders_tab2 = st.checkbox(
-                    "Mostrar limites Estaduais",
-                    value=False,
-                    key='show_state_tab2',
-                    help="Ativa/desativa a visualização dos limites dos Estados"
-                )
+                # Controle de visualização de contornos de RM
+                col_ctrl1, col_ctrl2 = st.columns(2)
+                with col_ctrl1:
+                    show_rm_borders_tab2 = st.checkbox(
+                        "Mostrar contornos de Regiões Metropolitanas",
+                        value=False,
+                        key='show_rm_tab2',
+                        help="Ativa/desativa a visualização dos contornos das RMs"
+                    )
+                with col_ctrl2:
+                    show_state_borders_tab2 = st.checkbox(
+                        "Mostrar limites Estaduais",
+                        value=False,
+                        key='show_state_tab2',
+                        help="Ativa/desativa a visualização dos limites dos Estados"
+                    )
 
-            if gdf is not None:
-                # Tentar carregar GDF do snapshot
-                gdf_consolidated = snapshot_loader.get_geodataframe_for_step('step5', gdf[gdf['uf'].isin(selected_ufs)].copy())
+                if gdf is not None:
+                    # Tentar carregar GDF do snapshot
+                    gdf_ufs = filter_gdf(gdf_token, ufs_key, (), gdf)
+                    gdf_consolidated = snapshot_loader.get_geodataframe_for_step('step5', gdf_ufs)
                 
-                if gdf_consolidated is None:
-                    # Fallback
-                    gdf_consolidated = consolidation_loader.apply_post_unitary_to_dataframe(
-                        gdf[gdf['uf'].isin(selected_ufs)].copy()
-                    )
+                    if gdf_consolidated is None:
+                        # Fallback
+                        gdf_consolidated = get_post_unitary_geodataframe(
+                            (gdf_token, ufs_key), consolidation_loader.get_post_unitary_token(),
+                            gdf_ufs, consolidation_loader
+                        )
                 
-                if selected_utps:
-                    gdf_consolidated = gdf_consolidated[
-                        gdf_consolidated['utp_id'].isin(selected_utps)
-                    ]
+                    if selected_utps:
+                        gdf_consolidated = gdf_consolidated[
+                            gdf_consolidated['utp_id'].isin(selected_utps)
+                        ]
                 
-                # Calcular coloração CONSOLIDADA sobre o frame consolidado (ou usar do snapshot)
-                # O snapshot loader já traz color_id. Podemos usar ele.
-                colors_consolidated = {}
+                    # Calcular coloração CONSOLIDADA sobre o frame consolidado (ou usar do snapshot)
+                    # O snapshot loader já traz color_id. Podemos usar ele.
+                    colors_consolidated = {}
                 
-                # Check if we have valid coloring in the snapshot
-                has_valid_coloring = False
-                if 'color_id' in gdf_consolidated.columns:
-                     unique_colors = gdf_consolidated['color_id'].unique()
-                     # If we have more than 1 color, OR if we have 1 color but it's not 0 (which is default/fallback)
-                     # actually 0 is a valid color index, but if ALL are 0, it's suspicious for a large map.
-                     if len(unique_colors) > 1:
-                         has_valid_coloring = True
-                     elif len(unique_colors) == 1 and unique_colors[0] != 0:
-                         has_valid_coloring = True
+                    # Check if we have valid coloring in the snapshot
+                    has_valid_coloring = False
+                    if 'color_id' in gdf_consolidated.columns:
+                         unique_colors = gdf_consolidated['color_id'].unique()
+                         # If we have more than 1 color, OR if we have 1 color but it's not 0 (which is default/fallback)
+                         # actually 0 is a valid color index, but if ALL are 0, it's suspicious for a large map.
+                         if len(unique_colors) > 1:
+                             has_valid_coloring = True
+                         elif len(unique_colors) == 1 and unique_colors[0] != 0:
+                             has_valid_coloring = True
                      
-                     if has_valid_coloring:
-                         for _, row in gdf_consolidated.iterrows():
-                             # Access CD_MUN safely (standardized in loader)
-                             col_name = 'CD_MUN' if 'CD_MUN' in row else 'cd_mun'
-                             colors_consolidated[int(row[col_name])] = int(row['color_id'])
+                         if has_valid_coloring:
+                             colors_consolidated = get_snapshot_colors(gdf_consolidated)
                 
-                # Fallback: Load from external cache if snapshot coloring is missing or seems invalid (monochromatic 0)
-                if not has_valid_coloring:
-                     logging.warning("⚠️ Snapshot coloring seems invalid or missing. Loading from consolidated_coloring.json fallback.")
-                     colors_consolidated = load_or_compute_coloring(gdf_consolidated, "consolidated_coloring.json")
+                    # Fallback: Load from external cache if snapshot coloring is missing or seems invalid (monochromatic 0)
+                    if not has_valid_coloring:
+                         logging.warning("⚠️ Snapshot coloring seems invalid or missing. Loading from consolidated_coloring.json fallback.")
+                         colors_consolidated = load_or_compute_coloring(gdf_consolidated, "consolidated_coloring.json")
                 
-                # Preparar contornos de estado
-                gdf_states_filtered = None
-                if show_state_borders_tab2:
-                    if gdf_states_optimized is not None:
-                        gdf_all_states = gdf_states_optimized
-                    elif gdf is not None:
-                        gdf_all_states = get_state_boundaries(gdf)
-                    else:
-                        gdf_all_states = None
-
-                    if gdf_all_states is not None and selected_ufs:
-                        gdf_states_filtered = gdf_all_states[gdf_all_states['uf'].isin(selected_ufs)]
-                    elif gdf_all_states is not None:
-                        gdf_states_filtered = gdf_all_states
-
-                # Renderizar mapa com opção de mostrar contornos de RM
-                # Renderizar mapa (TAB 2: Pós Consolidação)
-                m = render_map_with_flow_popups(
-                    gdf_consolidated,
-                    df_municipios, 
-                    title="Distribuição Consolidada (Snapshot)", 
-                    global_colors=colors_consolidated,
-                    gdf_rm=gdf_rm, 
-                    show_rm_borders=show_rm_borders_tab2,
-                    show_state_borders=show_state_borders_tab2,
-                    gdf_states=gdf_states_filtered,
-                    PASTEL_PALETTE=PASTEL_PALETTE,
-                    step_key='step5'
-                )
-                if m:
-                    map_html = m._repr_html_()
-                    st.components.v1.html(map_html, height=600, scrolling=False)
+                    # Preparar contornos de estado
+                    gdf_states_filtered = None
+                    if show_state_borders_tab2:
+                        if gdf_states_optimized is not None:
+                            gdf_all_states = gdf_states_optimized
+                        elif gdf is not None:
+                            gdf_all_states = get_state_boundaries(gdf_token, gdf)
+                        else:
+                            gdf_all_states = None
+
+                        if gdf_all_states is not None and selected_ufs:
+                            gdf_states_filtered = gdf_all_states[gdf_all_states['uf'].isin(selected_ufs)]
+                        elif gdf_all_states is not None:
+                            gdf_states_filtered = gdf_all_states
+
+                    # Renderizar mapa com opção de mostrar contornos de RM
+                    # Renderizar mapa (TAB 2: Pós Consolidação)
+                    map_html = get_map_html(
+                        'step5',
+                        get_map_signature(gdf_consolidated),
+                        tuple(selected_ufs),
+                        show_rm_borders_tab2,
+                        show_state_borders_tab2,
+                        gdf_consolidated,
+                        df_municipios,
+                        dict(
+                            title="Distribuição Consolidada (Snapshot)",
+                            global_colors=colors_consolidated,
+                            gdf_rm=gdf_rm,
+                            gdf_states=gdf_states_filtered,
+                            PASTEL_PALETTE=PASTEL_PALETTE
+                        )
+                    )
+                    if map_html:
+                        st.components.v1.html(map_html, height=600, scrolling=False)
             
-            st.markdown("---")
-            st.markdown("#### Configuração Territorial")
-            st.caption("UTPs, sedes e municípios conforme o snapshot desta versão (v8.1 – pós UTPs unitárias)")
-            _allowed_muns_tab2 = set(df_filtered['cd_mun'].astype(str).tolist()) if not df_filtered.empty else None
-            df_config_tab2 = render_territorial_config_table('step5', snapshot_loader, _allowed_muns_tab2)
-            if not df_config_tab2.empty:
-                st.dataframe(df_config_tab2, hide_index=True, use_container_width=True, height=400)
-            else:
-                st.info("Snapshot da versão 8.1 não encontrado. Execute o pipeline.")
+                st.markdown("---")
+                st.markdown("#### Configuração Territorial")
+                st.caption("UTPs, sedes e municípios conforme o snapshot desta versão (v8.1 – pós UTPs unitárias)")
+                _allowed_muns_tab2 = df_filtered['cd_mun'].unique() if not df_filtered.empty else None
+                df_config_tab2 = get_territorial_config_table('step5', snapshot_loader.get_mtime('step5'), _allowed_muns_tab2, snapshot_loader)
+                if not df_config_tab2.empty:
+                    st.dataframe(df_config_tab2, hide_index=True, use_container_width=True, height=400)
+                else:
+                    st.info("Snapshot da versão 8.1 não encontrado. Execute o pipeline.")
             
-            st.markdown("---")
-            st.markdown("#### Registro de Consolidações")
-            st.caption("Consolidações de UTPs unitárias (Steps 5+7) - SEM incluir consolidação de sedes")
+                st.markdown("---")
+                st.markdown("#### Registro de Consolidações")
+                st.caption("Consolidações de UTPs unitárias (Steps 5+7) - SEM incluir consolidação de sedes")
             
-            # Preparar dados para planilha - USAR DADOS PÓS-UNITÁRIAS
-            if post_unitary_consolidations:
-                df_consolidations = pd.DataFrame([
-                    {
-                        "ID": i + 1,
-                        "UTP Origem": c["source_utp"],
-                        "UTP Destino": c["target_utp"],
-                        "Motivo": c.get("reason", "N/A"),
-                        "Data": c["timestamp"][:10],
-                        "Hora": c["timestamp"][11:19]
-                    }
-                    for i, c in enumerate(post_unitary_consolidations)
-                ])
-                st.dataframe(df_consolidations, width='stretch', hide_index=True)
+                # Preparar dados para planilha - USAR DADOS PÓS-UNITÁRIAS
+                # A tabela fica recolhida: o registro pode ter centenas de linhas
+                if post_unitary_consolidations:
+                    with st.expander(f"Ver {len(post_unitary_consolidations)} consolidações", expanded=False):
+                        df_consolidations = pd.DataFrame([
+                            {
+                                "ID": i + 1,
+                                "UTP Origem": c["source_utp"],
+                                "UTP Destino": c["target_utp"],
+                                "Motivo": c.get("reason", "N/A"),
+                                "Data": c["timestamp"][:10],
+                                "Hora": c["timestamp"][11:19]
+                            }
+                            for i, c in enumerate(post_unitary_consolidations)
+                        ])
+                        st.dataframe(df_consolidations, width='stretch', hide_index=True)
             
-            # Download do resultado
-            result_json = json.dumps(consolidation_loader.result, ensure_ascii=False, indent=2)
-            st.download_button(
-                label="Baixar Resultado de Consolidação",
-                data=result_json,
-                file_name=f"consolidation_result_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
-                mime="application/json"
-            )
+                # Download do resultado
+                result_path = consolidation_loader.result_path
+                result_mtime = result_path.stat().st_mtime if result_path.exists() else None
+                st.download_button(
+                    label="Baixar Resultado de Consolidação",
+                    # Serializado só no clique (e memoizado por versão do arquivo)
+                    data=lambda: get_consolidation_result_bytes(
+                        str(result_path), result_mtime, consolidation_loader.result
+                    ),
+                    file_name=f"consolidation_result_{get_export_timestamp()}.json.gz",
+                    mime="application/gzip"
+                )
+        render_tab2()
             
 
 
@@ -1111,150 +1663,140 @@ def render_dashboard(manager):
 
     # ==== TAB 3: CONSOLIDAÇÃO SEDES ====
     with tab3:
-        st.markdown("### <span class='step-badge step-final'>Versão 8.2</span> Dependência entre Sedes", unsafe_allow_html=True)
-        st.markdown("""
-        **O objetivo desta etapa é fundir territórios quando a sede de uma UTP demonstra uma dependência funcional em relação a outra sede vizinha. Para que um UTP seja absorvida por outra, aplicamos quatro filtros sequenciais:**
+        @st.fragment
+        def render_tab3():
+            st.markdown("### <span class='step-badge step-final'>Versão 8.2</span> Dependência entre Sedes", unsafe_allow_html=True)
+            st.markdown("""
+            **O objetivo desta etapa é fundir territórios quando a sede de uma UTP demonstra uma dependência funcional em relação a outra sede vizinha. Para que um UTP seja absorvida por outra, aplicamos quatro filtros sequenciais:**
         
-        1.  **Dependência de fluxo e tempo:** a sede da UTP “A” deve ter seu fluxo principal de viagens voltado para a sede da UTP “B”, com um tempo de deslocamento de <= 2h.
-        2.  **Compatibilidade de RM:** ambas as sedes pertencem à mesma Região Metropolitana ou ambas não pertencem a nenhuma.
-        3.  **Adjacência Geográfica:** As UTPs devem compartilhar uma fronteira física com a UTP de destino.
-        4.  **Pontuação de Infraestrutura:** A UTP de destino deve possuir um nível de infraestrutura (Aeroportos, Turismo e REGIC) superior a UTP de origem.
-        """)
-        st.markdown("---")
+            1.  **Dependência de fluxo e tempo:** a sede da UTP “A” deve ter seu fluxo principal de viagens voltado para a sede da UTP “B”, com um tempo de deslocamento de <= 2h.
+            2.  **Compatibilidade de RM:** ambas as sedes pertencem à mesma Região Metropolitana ou ambas não pertencem a nenhuma.
+            3.  **Adjacência Geográfica:** As UTPs devem compartilhar uma fronteira física com a UTP de destino.
+            4.  **Pontuação de Infraestrutura:** A UTP de destino deve possuir um nível de infraestrutura (Aeroportos, Turismo e REGIC) superior a UTP de origem.
+            """)
+            st.markdown("---")
 
-        # Verificar se existe resultado dedicado de Sedes
-        sede_executed = consolidation_loader.is_sede_executed()
+            # Verificar se existe resultado dedicado de Sedes
+            sede_executed = consolidation_loader.is_sede_executed()
         
-        if sede_executed:
-             sede_result = consolidation_loader.get_sede_result()
-             sede_consolidations = sede_result.get('consolidations', [])
-             sede_mapping = sede_result.get('utps_mapping', {})
+            if sede_executed:
+                 sede_result = consolidation_loader.get_sede_result()
+                 sede_consolidations = sede_result.get('consolidations', [])
+                 sede_mapping = sede_result.get('utps_mapping', {})
              
-             if gdf is not None:
-                 # Filtrar GDF
-                 gdf_sliced = gdf[gdf['uf'].isin(selected_ufs)].copy()
-                 if selected_utps:
-                     gdf_sliced = gdf_sliced[gdf_sliced['utp_id'].isin(selected_utps)]
+                 if gdf is not None:
+                     # Filtrar GDF
+                     gdf_sliced = filter_gdf(gdf_token, ufs_key, utps_key, gdf)
                      
-                 # Aplicar consolidação TOTAL via Snapshot Step 6
-                 gdf_final = snapshot_loader.get_geodataframe_for_step('step6', gdf_sliced)
+                     # Aplicar consolidação TOTAL via Snapshot Step 6
+                     gdf_final = snapshot_loader.get_geodataframe_for_step('step6', gdf_sliced)
                  
-                 if gdf_final is None:
-                     # Fallback
-                     gdf_final = consolidation_loader.apply_consolidations_to_dataframe(gdf_sliced, custom_mapping=total_mapping)
+                     if gdf_final is None:
+                         # Fallback
+                         gdf_final = consolidation_loader.apply_consolidations_to_dataframe(gdf_sliced, custom_mapping=total_mapping)
                  
-                 # === MÉTRICAS PADRONIZADAS ===
-                 if not gdf_final.empty:
-                    col1, col2, col3 = st.columns(3)
-                    with col1:
-                        # Contagem única de municípios (coluna pode variar caixa dependendo da fonte, normalizar)
-                        col_cd = 'CD_MUN' if 'CD_MUN' in gdf_final.columns else 'cd_mun'
-                        current_unique = gdf_final[col_cd].astype(str).nunique()
-                        total_unique = df_municipios['cd_mun'].nunique()
-                        st.metric("Municípios", current_unique, f"{total_unique} total")
-                    with col2:
-                        current_utps = gdf_final['utp_id'].nunique()
-                        st.metric("UTPs", current_utps, f"{len(utps_list)} total")
-                    with col3:
-                        current_ufs = gdf_final['uf'].nunique()
-                        st.metric("Estados", current_ufs, f"{len(ufs)} total")
+                     # === MÉTRICAS PADRONIZADAS ===
+                     if not gdf_final.empty:
+                        render_territory_metrics(gdf_final, total_municipios, len(utps_list), len(ufs))
                  
-                 st.markdown("---")
-
-                 # Controle de visualização de contornos
-                 col_ctrl1, col_ctrl2 = st.columns(2)
-                 with col_ctrl1:
-                     show_rm_borders_tab3 = st.checkbox(
-                         "Mostrar contornos de Regiões Metropolitanas",
-                         value=False,
-                         key='show_rm_tab3'
-                     )
-                 with col_ctrl2:
-                     show_state_borders_tab3 = st.checkbox(
-                         "Mostrar limites Estaduais",
-                         value=False,
-                         key='show_state_tab3'
+                     st.markdown("---")
+
+                     # Controle de visualização de contornos
+                     col_ctrl1, col_ctrl2 = st.columns(2)
+                     with col_ctrl1:
+                         show_rm_borders_tab3 = st.checkbox(
+                             "Mostrar contornos de Regiões Metropolitanas",
+                             value=False,
+                             key='show_rm_tab3'
+                         )
+                     with col_ctrl2:
+                         show_state_borders_tab3 = st.checkbox(
+                             "Mostrar limites Estaduais",
+                             value=False,
+                             key='show_state_tab3'
+                         )
+
+                     # Renderizar
+                     # Tentar carregar coloração final específica se existir, senão usa a consolidada padrão
+                     colors_final = {}
+                     if 'color_id' in gdf_final.columns:
+                         colors_final = get_snapshot_colors(gdf_final)
+                     else:
+                         colors_final = load_or_compute_coloring(gdf_final, "post_sede_coloring.json")
+
+                     # Preparar contornos de estado
+                     gdf_states_filtered = None
+                     if show_state_borders_tab3:
+                        if gdf_states_optimized is not None:
+                            gdf_all_states = gdf_states_optimized
+                        elif gdf is not None:
+                            gdf_all_states = get_state_boundaries(gdf_token, gdf)
+                        else:
+                            gdf_all_states = None
+
+                        if gdf_all_states is not None and selected_ufs:
+                            gdf_states_filtered = gdf_all_states[gdf_all_states['uf'].isin(selected_ufs)]
+                        elif gdf_all_states is not None:
+                            gdf_states_filtered = gdf_all_states
+
+                     # Renderizar mapa usando render_map_with_flow_popups
+                     map_html = get_map_html(
+                         'step6',
+                         get_map_signature(gdf_final),
+                         tuple(selected_ufs),
+                         show_rm_borders_tab3,
+                         show_state_borders_tab3,
+                         gdf_final,
+                         df_municipios,
+                         dict(
+                             title="Final (Snapshot)",
+                             global_colors=colors_final,
+                             gdf_rm=gdf_rm,
+                             gdf_states=gdf_states_filtered,
+                             PASTEL_PALETTE=PASTEL_PALETTE
+                         )
                      )
-
-                 # Renderizar
-                 # Tentar carregar coloração final específica se existir, senão usa a consolidada padrão
-                 colors_final = {}
-                 if 'color_id' in gdf_final.columns:
-                     for _, row in gdf_final.iterrows():
-                         col_name = 'CD_MUN' if 'CD_MUN' in row else 'cd_mun'
-                         colors_final[int(row[col_name])] = int(row['color_id'])
+                     if map_html:
+                          st.components.v1.html(map_html, height=600, scrolling=False)
                  else:
-                     colors_final = load_or_compute_coloring(gdf_final, "post_sede_coloring.json")
-
-                 # Preparar contornos de estado
-                 gdf_states_filtered = None
-                 if show_state_borders_tab3:
-                    if gdf_states_optimized is not None:
-                        gdf_all_states = gdf_states_optimized
-                    elif gdf is not None:
-                        gdf_all_states = get_state_boundaries(gdf)
-                    else:
-                        gdf_all_states = None
-
-                    if gdf_all_states is not None and selected_ufs:
-                        gdf_states_filtered = gdf_all_states[gdf_all_states['uf'].isin(selected_ufs)]
-                    elif gdf_all_states is not None:
-                        gdf_states_filtered = gdf_all_states
-
-                 # Renderizar mapa usando render_map_with_flow_popups
-                 m = render_map_with_flow_popups(
-                     gdf_final, 
-                     df_municipios,
-                     title="Final (Snapshot)", 
-                     global_colors=colors_final, 
-                     gdf_rm=gdf_rm, 
-                     show_rm_borders=show_rm_borders_tab3,
-                     show_state_borders=show_state_borders_tab3,
-                     gdf_states=gdf_states_filtered,
-                     PASTEL_PALETTE=PASTEL_PALETTE,
-                     step_key='step6'
-                 )
-                 if m:
-                      map_html = m._repr_html_()
-                      st.components.v1.html(map_html, height=600, scrolling=False)
-             else:
-                 st.warning("Mapa indisponível")
+                     st.warning("Mapa indisponível")
              
-             st.markdown("---")
-             st.markdown("#### Configuração Territorial")
-             st.caption("UTPs, sedes e municípios conforme o snapshot desta versão (v8.2 – pós consolidação de sedes)")
-             _allowed_muns_tab3 = set(df_filtered['cd_mun'].astype(str).tolist()) if not df_filtered.empty else None
-             df_config_tab3 = render_territorial_config_table('step6', snapshot_loader, _allowed_muns_tab3)
-             if not df_config_tab3.empty:
-                 st.dataframe(df_config_tab3, hide_index=True, use_container_width=True, height=400)
-             else:
-                 st.info("Snapshot da versão 8.2 não encontrado. Execute o pipeline.")
+                 st.markdown("---")
+                 st.markdown("#### Configuração Territorial")
+                 st.caption("UTPs, sedes e municípios conforme o snapshot desta versão (v8.2 – pós consolidação de sedes)")
+                 _allowed_muns_tab3 = df_filtered['cd_mun'].unique() if not df_filtered.empty else None
+                 df_config_tab3 = get_territorial_config_table('step6', snapshot_loader.get_mtime('step6'), _allowed_muns_tab3, snapshot_loader)
+                 if not df_config_tab3.empty:
+                     st.dataframe(df_config_tab3, hide_index=True, use_container_width=True, height=400)
+                 else:
+                     st.info("Snapshot da versão 8.2 não encontrado. Execute o pipeline.")
              
-             st.markdown("---")
-             # Tabela de Mudanças Específicas desta Etapa
-             st.markdown("#### Detalhes das Alterações de Sedes")
+                 st.markdown("---")
+                 # Tabela de Mudanças Específicas desta Etapa
+                 st.markdown("#### Detalhes das Alterações de Sedes")
              
-             # Criar tabela detalhada
-             changes_data = []
-             for c in sede_consolidations:
-                 # Detalhes estão em 'details'
-                 details = c.get('details', {})
-                 mun_id = details.get('mun_id')
-                 nm_mun = details.get('nm_mun', str(mun_id))
+                 # Criar tabela detalhada
+                 changes_data = []
+                 for c in sede_consolidations:
+                     # Detalhes estão em 'details'
+                     details = c.get('details', {})
+                     mun_id = details.get('mun_id')
+                     nm_mun = details.get('nm_mun', str(mun_id))
                  
-                 changes_data.append({
-                     "Município": nm_mun,
-                     "UTP Origem": c['source_utp'],
-                     "UTP Destino": c['target_utp'],
-                     "Tipo": "Sede da UTP" if details.get('is_sede') else "Município Componente",
-                     "Motivo": c['reason']
-                 })
+                     changes_data.append({
+                         "Município": nm_mun,
+                         "UTP Origem": c['source_utp'],
+                         "UTP Destino": c['target_utp'],
+                         "Tipo": "Sede da UTP" if details.get('is_sede') else "Município Componente",
+                         "Motivo": c['reason']
+                     })
              
-             st.dataframe(pd.DataFrame(changes_data), hide_index=True, width='stretch')
+                 st.dataframe(pd.DataFrame(changes_data), hide_index=True, width='stretch')
 
-        else:
-             st.info("Nenhuma consolidação de sedes encontrada.")
-             st.caption("Execute a Etapa 6 do pipeline e certifique-se que houve consolidações.")
+            else:
+                 st.info("Nenhuma consolidação de sedes encontrada.")
+                 st.caption("Execute a Etapa 6 do pipeline e certifique-se que houve consolidações.")
+        render_tab3()
     
     # ==== TAB 4: DUPLA ADERÊNCIA / CENTRALIZAÇÃO ====
     with tab4:
@@ -1303,7 +1845,7 @@ def render_dashboard(manager):
                         st.markdown(f"#### Top 10 Municípios por Fluxo - UTP {selected_utp_for_flow}")
                         
                         # Exibir tabela formatada
-                        df_display = df_utp_flows.copy()
+                        df_display = df_utp_flows
                         df_display['total_flow'] = df_display['total_flow'].apply(lambda x: f"{x:,}")
                         df_display['rodoviaria_coletiva'] = df_display['rodoviaria_coletiva'].apply(lambda x: f"{x:,}")
                         df_display['rodoviaria_particular'] = df_display['rodoviaria_particular'].apply(lambda x: f"{x:,}")
@@ -1331,7 +1873,7 @@ def render_dashboard(manager):
         
         # Visualizar Mapa Snapshot Step 8
         if gdf is not None:
-             gdf_borders = snapshot_loader.get_geodataframe_for_step('step8', gdf[gdf['uf'].isin(selected_ufs)].copy())
+             gdf_borders = snapshot_loader.get_geodataframe_for_step('step8', filter_gdf(gdf_token, ufs_key, (), gdf))
              
              if gdf_borders is not None:
                  if selected_utps:
@@ -1342,26 +1884,13 @@ def render_dashboard(manager):
                  
                  # === MÉTRICAS PADRONIZADAS (MOVIDO PARA CIMA DO MAPA) ===
                  if not gdf_borders.empty:
-                    col1, col2, col3 = st.columns(3)
-                    with col1:
-                        col_cd = 'CD_MUN' if 'CD_MUN' in gdf_borders.columns else 'cd_mun'
-                        current_unique = gdf_borders[col_cd].astype(str).nunique()
-                        total_unique = df_municipios['cd_mun'].nunique()
-                        st.metric("Municípios", current_unique, f"{total_unique} total")
-                    with col2:
-                        current_utps = gdf_borders['utp_id'].nunique()
-                        st.metric("UTPs", current_utps, f"{len(utps_list)} total")
-                    with col3:
-                        current_ufs = gdf_borders['uf'].nunique()
-                        st.metric("Estados", current_ufs, f"{len(ufs)} total")
+                    render_territory_metrics(gdf_borders, total_municipios, len(utps_list), len(ufs))
                     
                     st.markdown("---")
                  
                  colors_borders = {}
                  if 'color_id' in gdf_borders.columns:
-                     for _, row in gdf_borders.iterrows():
-                         col_name = 'CD_MUN' if 'CD_MUN' in row else 'cd_mun'
-                         colors_borders[int(row[col_name])] = int(row['color_id'])
+                     colors_borders = get_snapshot_colors(gdf_borders)
                  
                  # Controle de visualização de contornos
                  col_ctrl1, col_ctrl2 = st.columns(2)
@@ -1384,7 +1913,7 @@ def render_dashboard(manager):
                     if gdf_states_optimized is not None:
                         gdf_all_states = gdf_states_optimized
                     elif gdf is not None:
-                        gdf_all_states = get_state_boundaries(gdf)
+                        gdf_all_states = get_state_boundaries(gdf_token, gdf)
                     else:
                         gdf_all_states = None
 
@@ -1397,32 +1926,34 @@ def render_dashboard(manager):
                  # IMPORTANTE: Usar df_step8_with_flows para que os popups mostrem
                  # os fluxos baseados nas UTPs atualizadas do Step 8
                  try:
-                     map_with_flows = render_map_with_flow_popups(
+                     map_html = get_map_html(
+                         'step8',
+                         get_map_signature(gdf_borders),
+                         tuple(selected_ufs),
+                         show_rm_borders_tab4,
+                         show_state_borders_tab4,
                          gdf_borders,
                          df_step8_with_flows,  # Dados com UTP atualizada + fluxos
-                         title="Validação Fronteiras (Snapshot)",
-                         global_colors=colors_borders,
-                         gdf_rm=gdf_rm, 
-                         show_rm_borders=show_rm_borders_tab4,
-                         show_state_borders=show_state_borders_tab4,
-                         gdf_states=gdf_states_filtered,
-                         PASTEL_PALETTE=PASTEL_PALETTE,
-                         step_key='step8'
+                         dict(
+                             title="Validação Fronteiras (Snapshot)",
+                             global_colors=colors_borders,
+                             gdf_rm=gdf_rm,
+                             gdf_states=gdf_states_filtered,
+                             PASTEL_PALETTE=PASTEL_PALETTE
+                         )
                      )
                      
-                     if map_with_flows:
-                         map_html = map_with_flows._repr_html_()
+                     if map_html:
                          st.components.v1.html(map_html, height=600, scrolling=False)
                  except Exception as e:
                      logging.error(f"Erro ao renderizar mapa com fluxos: {e}")
                      st.error(f"Erro ao renderizar mapa: {e}")
-                     st.error(f"Erro ao renderizar mapa: {e}")
                  
                  st.markdown("---")
                  st.markdown("#### Configuração Territorial")
                  st.caption("UTPs, sedes e municípios conforme o snapshot desta versão (v8.3 – pós validação de fronteiras)")
-                 _allowed_muns_tab4 = set(df_filtered['cd_mun'].astype(str).tolist()) if not df_filtered.empty else None
-                 df_config_tab4 = render_territorial_config_table('step8', snapshot_loader, _allowed_muns_tab4)
+                 _allowed_muns_tab4 = df_filtered['cd_mun'].unique() if not df_filtered.empty else None
+                 df_config_tab4 = get_territorial_config_table('step8', snapshot_loader.get_mtime('step8'), _allowed_muns_tab4, snapshot_loader)
                  if not df_config_tab4.empty:
                      st.dataframe(df_config_tab4, hide_index=True, use_container_width=True, height=400)
                  else:
@@ -1430,232 +1961,4 @@ def render_dashboard(manager):
                  
                  st.markdown("---")
         
-        # Carregar dados de validação de fronteiras
-        borders_json_path = Path(__file__).parent.parent.parent / "data" / "03_processed" / "border_validation_result.json"
-        
-        if borders_json_path.exists():
-            try:
-                with open(borders_json_path, 'r', encoding='utf-8') as f:
-                    borders_data = json.load(f)
-                
-                metadata = borders_data.get('metadata', {})
-                relocations = borders_data.get('relocations', [])
-                rejections = borders_data.get('rejections', [])
-                transitive_chains = borders_data.get('transitive_chains', [])
-                
-                # === MÉTRICAS PADRONIZADAS (REMOVIDO DAQUI) ===
-                # (Movido para cima do mapa)
-                
-                st.markdown("---")
-                
-                # === CADEIAS TRANSITIVAS ===
-                if transitive_chains:
-                    st.markdown("#### 🔗 Cadeias Transitivas Detectadas")
-                    st.caption(f"{len(transitive_chains)} cadeia(s) transitiva(s) resolvida(s)")
-                    
-                    for i, chain in enumerate(transitive_chains, 1):
-                        chain_str = " → ".join(chain['chain'])
-                        final_utp = chain['final_utp']
-                        st.info(f"**Cadeia {i}:** {chain_str} → **UTP {final_utp}**")
-                    
-                    st.markdown("---")
-                
-                # === TABS INTERNAS: REALOCAÇÕES VS REJEIÇÕES ===
-                subtab1, subtab2 = st.tabs(["Realocações", "Rejeições"])
-                
-                with subtab1:
-                    st.markdown("#### Municípios Realocados")
-                    
-                if relocations:
-                    # Preparar dados para tabela (Usando lista atual)
-                    relocations_df = pd.DataFrame([
-                        {
-                            "Município": r['mun_name'],
-                            "CD_MUN": r['mun_id'],
-                            "UTP Origem": r['utp_origem'],
-                            "UTP Destino": r['utp_destino'],
-                            "Iteração": r.get('iteration', 1),
-                            "Motivo": r.get('reason', 'N/A')
-                        }
-                        for r in relocations
-                    ])
-                else:
-                    # Tentar carregar HISTÓRICO da ConsolidationManager se a lista atual estiver vazia
-                    # Isso garante que a tabela mostre o histórico mesmo se a última execução foi limpa
-                    
-                    history_consolidations = consolidation_loader.get_consolidations()
-                    border_history = []
-                    
-                    for c in history_consolidations:
-                        # Identificar registros de validação de fronteira pelo "reason" ou "details"
-                        reason = str(c.get('reason', ''))
-                        details = c.get('details', {})
-                        
-                        if "Border validation" in reason or details.get('step') == 'border_validation':
-                             # Extrair dados do formato do ConsolidationManager
-                             mun_nm = details.get('municipality_name', str(details.get('municipality_id', 'Unknown')))
-                             
-                             border_history.append({
-                                "Município": mun_nm,
-                                "CD_MUN": details.get('municipality_id', 0),
-                                "UTP Origem": c['source_utp'],
-                                "UTP Destino": c['target_utp'],
-                                "Iteração": details.get('iteration', 1),
-                                "Motivo": reason
-                             })
-                    
-                    if border_history:
-                        relocations_df = pd.DataFrame(border_history)
-                        st.info(f"Mostrando histórico acumulado de {len(relocations_df)} realocações (execuções anteriores)")
-                    else:
-                        relocations_df = pd.DataFrame()
-
-                # Só renderizar se tiver dados (seja atual ou histórico)
-                if not relocations_df.empty:
-                        
-                    # Estatísticas
-                    st.markdown(f"**{len(relocations_df)} municípios realocados**")
-                        
-                    col1, col2 = st.columns(2)
-                    with col1:
-                        st.metric("UTPs Origem Únicas", relocations_df['UTP Origem'].nunique())
-                    with col2:
-                        st.metric("UTPs Destino Únicas", relocations_df['UTP Destino'].nunique())
-                    
-                    # Distribuição por iteração
-                    st.markdown("**Distribuição por Iteração:**")
-                    iter_counts = relocations_df['Iteração'].value_counts().sort_index()
-                    for iter_num, count in iter_counts.items():
-                        st.write(f"- Iteração {iter_num}: {count} realocações")
-                    
-                    st.markdown("---")
-                    st.markdown("**Detalhes:**")
-                    st.dataframe(relocations_df, hide_index=True, width='stretch', height=400)
-                    
-                    # Visualização no mapa
-                    if gdf is not None:
-                        st.markdown("---")
-                        st.markdown("#### Mapa de Municípios Realocados")
-                        
-                        # Destacar municípios realocados
-                        # Precisamos extrair IDs da tabela consolidada
-                        if 'CD_MUN' in relocations_df.columns:
-                             relocated_ids = set(relocations_df['CD_MUN'].unique())
-                             gdf_highlight = gdf[gdf['CD_MUN'].isin(relocated_ids)].copy()
-                             
-                             if not gdf_highlight.empty:
-                                 st.caption(f"Destacando {len(gdf_highlight)} municípios realocados")
-                                 
-                                 # Criar mapa básico
-                                 m = folium.Map(
-                                     location=[-15, -55],
-                                     zoom_start=4,
-                                     tiles="CartoDB positron"
-                                 )
-                                 
-                                 # Adicionar municípios realocados em destaque
-                                 folium.GeoJson(
-                                     gdf_highlight.to_json(),
-                                     style_function=lambda x: {
-                                         'fillColor': '#FF6B6B',
-                                         'color': '#C92A2A',
-                                         'weight': 2,
-                                         'fillOpacity': 0.7
-                                     },
-                                     tooltip=folium.GeoJsonTooltip(
-                                         fields=['NM_MUN', 'utp_id', 'uf'],
-                                         aliases=['Município:', 'UTP:', 'UF:']
-                                     )
-                                 ).add_to(m)
-                                 
-                                 # Fit bounds
-                                 if not gdf_highlight.empty:
-                                     bounds = gdf_highlight.total_bounds
-                                     m.fit_bounds([[bounds[1], bounds[0]], [bounds[3], bounds[2]]])
-                                 
-                                 map_html = m._repr_html_()
-                                 st.components.v1.html(map_html, height=500, scrolling=False)
-
-                else:
-                    if not relocations and not 'border_history' in locals():
-                         st.info("Nenhuma realocação foi realizada.")
-                         st.caption("Todas as fronteiras já estão otimizadas!")
-                
-                with subtab2:
-                    st.markdown("#### Propostas de Realocação Rejeitadas")
-                    
-                    if rejections:
-                        # Preparar dados para tabela
-                        rejections_df = pd.DataFrame([
-                            {
-                                "Município": r['mun_name'],
-                                "CD_MUN": r['mun_id'],
-                                "UTP Atual": r['utp_origem'],
-                                "UTP Proposta": r.get('proposed_utp', 'N/A'),
-                                "Motivo": r.get('reason', 'N/A'),
-                                "Detalhes": r.get('details', ''),
-                                "Iteração": r.get('iteration', 1)
-                            }
-                            for r in rejections
-                        ])
-                        
-                        st.markdown(f"**{len(rejections_df)} propostas rejeitadas**")
-                        
-                        # Análise de motivos
-                        st.markdown("**Distribuição de Motivos de Rejeição:**")
-                        reason_counts = rejections_df['Motivo'].value_counts()
-                        for reason, count in reason_counts.items():
-                            percentage = (count / len(rejections_df)) * 100
-                            st.write(f"- {reason}: {count} ({percentage:.1f}%)")
-                        
-                        st.markdown("---")
-                        st.markdown("**Detalhes:**")
-                        st.dataframe(rejections_df, hide_index=True, width='stretch', height=400)
-                    else:
-                        st.success("✅ Nenhuma rejeição! Todas as propostas foram aceitas.")
-                
-                # === DOWNLOAD ===
-                st.markdown("---")
-                col1, col2 = st.columns(2)
-                
-                with col1:
-                    # Download JSON
-                    borders_json = json.dumps(borders_data, ensure_ascii=False, indent=2)
-                    st.download_button(
-                        label="Baixar Resultados (JSON)",
-                        data=borders_json,
-                        file_name=f"border_validation_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
-                        mime="application/json"
-                    )
-                
-                with col2:
-                    # Download CSV
-                    csv_path = Path(__file__).parent.parent.parent / "data" / "03_processed" / "border_validation_result.csv"
-                    if csv_path.exists():
-                        with open(csv_path, 'r', encoding='utf-8-sig') as f:
-                            csv_data = f.read()
-                        st.download_button(
-                            label="Baixar Resultados (CSV)",
-                            data=csv_data,
-                            file_name=f"border_validation_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-                            mime="text/csv"
-                        )
-                
-            except Exception as e:
-                st.error(f"Erro ao carregar dados de validação de fronteiras: {e}")
-                import traceback
-                st.code(traceback.format_exc())
-        else:
-            st.warning("⚠️ Dados de validação de fronteiras não encontrados")
-            st.info("""
-            **Como gerar os dados:**
-            1. Execute o pipeline completo: `python main.py`
-            2. Ou execute apenas a consolidação: `python src/run_consolidation.py`
-            
-            O Step 8 (Validação de Fronteiras) será executado automaticamente e gerará os arquivos:
-            - `data/03_processed/border_validation_result.json`
-            - `data/03_processed/border_validation_result.csv`
-            """)
-
-
-
+        render_border_validation_panel(consolidation_loader, gdf)
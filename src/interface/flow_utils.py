@@ -157,7 +157,7 @@ def get_top_municipalities_in_utp(
         DataFrame with top municipalities, their flows, and modal breakdown
     """
     # Filter municipalities in the UTP
-    utp_municipalities = df_municipios[df_municipios['utp_id'] == utp_id].copy()
+    utp_municipalities = df_municipios[df_municipios['utp_id'] == utp_id]
     
     if utp_municipalities.empty:
         return pd.DataFrame()
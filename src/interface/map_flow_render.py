@@ -1,20 +1,34 @@
 """
 Helper function to render map with flow information popups for border validation tab.
 """
-import folium
+import base64
+import io
 import logging
+import numpy as np
 import pandas as pd
+import shapely
 from src.interface.flow_utils import get_top_destinations_for_municipality, format_flow_popup_html, load_idh_pib_data, get_idh_for_municipality
 
 logger = logging.getLogger(__name__)
 
+# Casas decimais das coordenadas enviadas ao navegador (1e-5° ≈ 1 m)
+COORD_PRECISION = 5
+
+
+def simplify_for_display(geometries, tolerance):
+    """
+    Simplifica as geometrias para a escala do mapa e arredonda as coordenadas
+    a COORD_PRECISION casas, encurtando o GeoJSON serializado pelo folium.
+    """
+    simplified = shapely.simplify(geometries, tolerance, preserve_topology=True)
+    return shapely.transform(simplified, lambda coords: np.round(coords, COORD_PRECISION))
 
 
 def render_map_with_flow_popups(gdf_filtered, df_municipios, title="Mapa", 
                                   global_colors=None, gdf_rm=None, show_rm_borders=False, 
                                   show_state_borders=False, gdf_states=None,
                                   PASTEL_PALETTE=None, df_impedance=None, scroll_wheel_zoom=True,
-                                  step_key='step8'):
+                                  step_key='step8', raster_threshold=None):
     """
     Renderiza mapa folium com popups informativos de fluxo.
     
@@ -31,7 +45,11 @@ def render_map_with_flow_popups(gdf_filtered, df_municipios, title="Mapa",
         df_impedance: Optional DataFrame com dados de tempo de viagem (origem_6, destino_6, tempo_horas)
         scroll_wheel_zoom: Se deve habilitar zoom com scroll do mouse (default True)
         step_key: Pipeline step key for loading the correct popup file ('step1', 'step5', 'step6', 'step8')
+        raster_threshold: Acima deste número de municípios, desenha-os como imagem
+                          (sem popups). None mantém sempre a camada vetorial.
     """
+    import folium
+
     if gdf_filtered is None or gdf_filtered.empty:
         return None
 
@@ -39,7 +57,7 @@ def render_map_with_flow_popups(gdf_filtered, df_municipios, title="Mapa",
 
 
     
-    gdf_filtered = gdf_filtered.copy()
+    # reset_index já devolve um novo objeto; sob copy-on-write não é preciso copiar antes
     gdf_filtered = gdf_filtered.reset_index(drop=True)
     gdf_filtered['color'] = '#cccccc'
     
@@ -49,14 +67,12 @@ def render_map_with_flow_popups(gdf_filtered, df_municipios, title="Mapa",
     
     if global_colors and PASTEL_PALETTE:
         try:
-            for idx, row in gdf_filtered.iterrows():
-                # Tenta acessar CD_MUN ou cd_mun
-                cd_mun_val = row.get('CD_MUN') if 'CD_MUN' in row else row.get('cd_mun')
-                if cd_mun_val is None: continue
-                
-                cd_mun = int(cd_mun_val)
-                color_idx = global_colors.get(cd_mun, 0) % len(PASTEL_PALETTE)
-                gdf_filtered.at[idx, 'color'] = PASTEL_PALETTE[color_idx]
+            # Tenta acessar CD_MUN ou cd_mun
+            cd_col = 'CD_MUN' if 'CD_MUN' in gdf_filtered.columns else 'cd_mun'
+            cd_mun = pd.to_numeric(gdf_filtered[cd_col], errors='coerce').astype('Int64')
+            palette = np.array(PASTEL_PALETTE)
+            color_idx = cd_mun.map(global_colors).fillna(0).astype(int).to_numpy() % len(palette)
+            gdf_filtered['color'] = np.where(cd_mun.isna(), '#cccccc', palette[color_idx])
             
             coloring_applied = True
         except Exception as e:
@@ -69,7 +85,7 @@ def render_map_with_flow_popups(gdf_filtered, df_municipios, title="Mapa",
             if len(utps_unique) > 0 and PASTEL_PALETTE:
                 colors = {utp: PASTEL_PALETTE[i % len(PASTEL_PALETTE)] 
                          for i, utp in enumerate(sorted(utps_unique))}
-                gdf_filtered['color'] = gdf_filtered['utp_id'].map(colors).fillna('#cccccc')
+                gdf_filtered['color'] = gdf_filtered['utp_id'].map(colors).astype(object).fillna('#cccccc')
         except Exception as e:
             logger.warning(f"Erro ao aplicar coloração fallback: {e}")
     
@@ -84,11 +100,121 @@ def render_map_with_flow_popups(gdf_filtered, df_municipios, title="Mapa",
     )
     
     # Fit bounds
+    tolerance = None
     if not gdf_filtered.empty:
         bounds = gdf_filtered.total_bounds
         m.fit_bounds([[bounds[1], bounds[0]], [bounds[3], bounds[2]]], padding=(0.05, 0.05))
+        
+        # Simplificação dependente do zoom: tolerância proporcional à extensão visível
+        # (visão nacional ~0.04°, uma UF ~0.005°, UTPs pequenas mantêm o detalhe pré-processado)
+        span = max(bounds[2] - bounds[0], bounds[3] - bounds[1])
+        tolerance = max(0.0002, span * 0.001)
+        gdf_filtered = gdf_filtered.set_geometry(
+            simplify_for_display(gdf_filtered.geometry.values, tolerance)
+        )
+    
+    # Visões com muitos municípios: camada raster única (sem popups/tooltips),
+    # evitando serializar milhares de polígonos + HTML de popup
+    if raster_threshold is not None and len(gdf_filtered) > raster_threshold:
+        add_raster_layer(m, gdf_filtered)
+    else:
+        add_municipality_layers(m, gdf_filtered, df_municipios, df_impedance=df_impedance, step_key=step_key)
     
+    # Adicionar camada de contornos de Regiões Metropolitanas (opcional)
+    if show_rm_borders and gdf_rm is not None and not gdf_rm.empty:
+        try:
+            rms_visible = gdf_filtered['regiao_metropolitana'].unique()
+            gdf_rm_filtered = gdf_rm[gdf_rm['regiao_metropolitana'].isin(rms_visible)]
+            
+            if not gdf_rm_filtered.empty:
+                folium.map.CustomPane("rm_borders", z_index=450).add_to(m)
+                
+                # Contornos seguem a mesma tolerância dos municípios
+                if tolerance is not None:
+                    gdf_rm_filtered = gdf_rm_filtered.set_geometry(
+                        simplify_for_display(gdf_rm_filtered.geometry.values, tolerance)
+                    )
+                
+                # Uma única FeatureCollection para todas as RMs; o tooltip vem das propriedades
+                gdf_rm_filtered['tooltip'] = (
+                    'RM: ' + gdf_rm_filtered['regiao_metropolitana'].astype(str)
+                    + ' (' + gdf_rm_filtered['uf'].astype(str) + ') - '
+                    + gdf_rm_filtered['count'].astype(str) + ' municípios'
+                )
+                folium.GeoJson(
+                    gdf_rm_filtered[['regiao_metropolitana', 'tooltip', 'geometry']].to_geo_dict(),
+                    style_function=lambda x: {
+                        'fillColor': 'none',
+                        'color': '#FF0000',
+                        'weight': 3,
+                        'fillOpacity': 0,
+                        'dashArray': '4, 4'
+                    },
+                    tooltip=folium.GeoJsonTooltip(fields=['tooltip'], aliases=[''], labels=False),
+                    name="Regiões Metropolitanas",
+                    pane="rm_borders"
+                ).add_to(m)
+            
+        except Exception as e:
+            logger.error(f"Erro ao renderizar RMs: {e}")
+
+    # Adicionar camada de contornos de Estados (se solicitado)
+    if show_state_borders:
+        try:
+            # Preferir GDF de estados fornecido (mais completo) ou calcular on-the-fly (apenas visíveis)
+            if gdf_states is not None and not gdf_states.empty:
+                gdf_states_to_render = gdf_states
+            elif not gdf_filtered.empty and 'uf' in gdf_filtered.columns:
+                # Fallback: Dissolver por UF para obter contornos dos municípios visíveis
+                gdf_states_to_render = gdf_filtered[['uf', 'geometry']].dissolve(by='uf', observed=True).reset_index()
+            else:
+                gdf_states_to_render = None
+            
+            if gdf_states_to_render is not None and not gdf_states_to_render.empty:
+                folium.map.CustomPane("state_borders", z_index=460).add_to(m)
+                
+                if tolerance is not None:
+                    gdf_states_to_render = gdf_states_to_render.set_geometry(
+                        simplify_for_display(gdf_states_to_render.geometry.values, tolerance)
+                    )
+                
+                folium.GeoJson(
+                    gdf_states_to_render.to_geo_dict(),
+                    name="Limites Estaduais",
+                    style_function=lambda x: {
+                        'fillColor': 'none',
+                        'color': '#0000FF', # Azul (destaque solicitado)
+                        'weight': 3,        # Aumentado para melhor visualização
+                        'fillOpacity': 0
+                    },
+                    tooltip=folium.GeoJsonTooltip(
+                        fields=['uf'],
+                        aliases=['Estado:'],
+                        localize=True
+                    ),
+                    pane="state_borders"
+                ).add_to(m)
+            
+        except Exception as e:
+            logger.error(f"Erro ao renderizar contornos estaduais: {e}")
+            
+    return m
+
+
+
+def add_municipality_layers(m, gdf_filtered, df_municipios, df_impedance=None, step_key='step8'):
+    """
+    Adiciona ao mapa as camadas vetoriais de municípios e sedes, com popups de fluxo.
     
+    Args:
+        m: folium.Map de destino
+        gdf_filtered: GeoDataFrame já colorido (coluna "color")
+        df_municipios: DataFrame completo com dados dos municípios (para lookup de fluxos)
+        df_impedance: Optional DataFrame com dados de tempo de viagem
+        step_key: Pipeline step key for loading the correct popup file
+    """
+    import folium
+
     # Load impedance data if not provided
     if df_impedance is None:
         try:
@@ -281,17 +407,22 @@ def render_map_with_flow_popups(gdf_filtered, df_municipios, title="Mapa",
 
     
     # Separar municípios regulares e sedes (AGORA COM POPUP_HTML)
-    gdf_members = gdf_filtered[~gdf_filtered['sede_utp']].copy()
-    gdf_seats = gdf_filtered[gdf_filtered['sede_utp']].copy()
+    # Apenas as colunas necessárias para o GeoJSON (reduz tamanho)
+    # Uma única máscara (numpy) serve às duas camadas
+    cols_to_keep = ['geometry', 'popup_html', 'color', 'NM_MUN', 'utp_id']
+    is_seat = gdf_filtered['sede_utp'].fillna(False).astype(bool).to_numpy()
+    gdf_members = gdf_filtered.loc[~is_seat, cols_to_keep]
+    gdf_seats = gdf_filtered.loc[is_seat, cols_to_keep]
+    
+    # Dicts vão direto ao folium, evitando serializar para string e re-parsear
+    # (mantém os "id" das features: o folium os usa como chave de estilo).
+    members_geojson = gdf_members.to_geo_dict() if not gdf_members.empty else None
+    seats_geojson = gdf_seats.to_geo_dict() if not gdf_seats.empty else None
     
     # Adicionar camada ÚNICA de Municípios Regulares
-    if not gdf_members.empty:
-        # Filtrar apenas colunas necessárias para o GeoJSON (reduz tamanho)
-        cols_to_keep = ['geometry', 'popup_html', 'color', 'NM_MUN', 'utp_id']
-        members_json = gdf_members[cols_to_keep].to_json()
-        
+    if members_geojson is not None:
         folium.GeoJson(
-            members_json,
+            members_geojson,
             name="Municípios",
             style_function=lambda feature: {
                 'fillColor': feature['properties'].get('color', '#cccccc'),
@@ -315,12 +446,9 @@ def render_map_with_flow_popups(gdf_filtered, df_municipios, title="Mapa",
         ).add_to(m)
     
     # Adicionar camada ÚNICA de Sedes (com estilo diferente)
-    if not gdf_seats.empty:
-        cols_to_keep = ['geometry', 'popup_html', 'color', 'NM_MUN', 'utp_id']
-        seats_json = gdf_seats[cols_to_keep].to_json()
-        
+    if seats_geojson is not None:
         folium.GeoJson(
-            seats_json,
+            seats_geojson,
             name="Sedes",
             style_function=lambda feature: {
                 'fillColor': feature['properties'].get('color', '#cccccc'),
@@ -342,76 +470,41 @@ def render_map_with_flow_popups(gdf_filtered, df_municipios, title="Mapa",
                 max_width=600
             )
         ).add_to(m)
-    
-    # Adicionar camada de contornos de Regiões Metropolitanas (opcional)
-    if show_rm_borders and gdf_rm is not None and not gdf_rm.empty:
-        try:
-            rms_visible = gdf_filtered['regiao_metropolitana'].unique()
-            gdf_rm_filtered = gdf_rm[gdf_rm['regiao_metropolitana'].isin(rms_visible)].copy()
-            
-            if not gdf_rm_filtered.empty:
-                folium.map.CustomPane("rm_borders", z_index=450).add_to(m)
-                
-                # Para RMs, são poucos objetos, loop é aceitável e permite tooltip customizado fácil
-                # Mas melhor fazer single layer se possível, porém tooltip varia.
-                # Como são < 50 RMs, loop é OK.
-                for idx, row in gdf_rm_filtered.iterrows():
-                    nome_rm = row['regiao_metropolitana']
-                    uf = row['uf']
-                    num_municipios = row['count']
-                    
-                    tooltip_rm = f"RM: {nome_rm} ({uf}) - {num_municipios} municípios"
-                    
-                    folium.GeoJson(
-                        row.geometry,
-                        style_function=lambda x: {
-                            'fillColor': 'none',
-                            'color': '#FF0000',
-                            'weight': 3,
-                            'fillOpacity': 0,
-                            'dashArray': '4, 4'
-                        },
-                        tooltip=tooltip_rm,
-                        name=f"RM: {nome_rm}",
-                        pane="rm_borders"
-                    ).add_to(m)
-            
-        except Exception as e:
-            logger.error(f"Erro ao renderizar RMs: {e}")
 
-    # Adicionar camada de contornos de Estados (se solicitado)
-    if show_state_borders:
-        try:
-            # Preferir GDF de estados fornecido (mais completo) ou calcular on-the-fly (apenas visíveis)
-            if gdf_states is not None and not gdf_states.empty:
-                gdf_states_to_render = gdf_states
-            elif not gdf_filtered.empty and 'uf' in gdf_filtered.columns:
-                # Fallback: Dissolver por UF para obter contornos dos municípios visíveis
-                gdf_states_to_render = gdf_filtered[['uf', 'geometry']].dissolve(by='uf').reset_index()
-            else:
-                gdf_states_to_render = None
-            
-            if gdf_states_to_render is not None and not gdf_states_to_render.empty:
-                folium.map.CustomPane("state_borders", z_index=460).add_to(m)
-                
-                folium.GeoJson(
-                    gdf_states_to_render.to_json(),
-                    name="Limites Estaduais",
-                    style_function=lambda x: {
-                        'fillColor': 'none',
-                        'color': '#0000FF', # Azul (destaque solicitado)
-                        'weight': 3,        # Aumentado para melhor visualização
-                        'fillOpacity': 0
-                    },
-                    tooltip=folium.GeoJsonTooltip(
-                        fields=['uf'],
-                        aliases=['Estado:'],
-                        localize=True
-                    ),
-                    pane="state_borders"
-                ).add_to(m)
-            
-        except Exception as e:
-            logger.error(f"Erro ao renderizar contornos estaduais: {e}")
-            
-    return m
+
+def add_raster_layer(m, gdf_filtered, width_px=1400):
+    """
+    Adiciona os municípios ao mapa como uma única imagem (ImageOverlay).
+    
+    A imagem é desenhada com matplotlib em Web Mercator (EPSG:3857), a mesma
+    projeção do Leaflet, então o overlay esticado entre os bounds em lat/lon
+    fica alinhado. Sedes recebem contorno preto, como na camada vetorial.
+    """
+    import folium
+    from matplotlib.figure import Figure
+    
+    gdf_merc = gdf_filtered.to_crs(epsg=3857)
+    minx, miny, maxx, maxy = gdf_merc.total_bounds
+    height_px = max(1, int(width_px * (maxy - miny) / max(maxx - minx, 1e-9)))
+    
+    fig = Figure(figsize=(width_px / 100, height_px / 100), dpi=100)
+    ax = fig.add_axes([0, 0, 1, 1])
+    ax.set_axis_off()
+    is_seat = gdf_merc['sede_utp'].fillna(False).astype(bool)
+    gdf_merc[~is_seat].plot(ax=ax, color=gdf_merc.loc[~is_seat, 'color'], edgecolor='#ffffff', linewidth=0.1)
+    if is_seat.any():
+        gdf_merc[is_seat].plot(ax=ax, color=gdf_merc.loc[is_seat, 'color'], edgecolor='#000000', linewidth=0.6)
+    ax.set_xlim(minx, maxx)
+    ax.set_ylim(miny, maxy)
+    
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png', transparent=True)
+    image_url = "data:image/png;base64," + base64.b64encode(buffer.getvalue()).decode('ascii')
+    
+    lon_min, lat_min, lon_max, lat_max = gdf_filtered.total_bounds
+    folium.raster_layers.ImageOverlay(
+        image_url,
+        bounds=[[lat_min, lon_min], [lat_max, lon_max]],
+        opacity=0.9,
+        name="Municípios"
+    ).add_to(m)
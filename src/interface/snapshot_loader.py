@@ -21,6 +21,13 @@ class SnapshotLoader:
             "step8": self.data_dir / "snapshot_step8_final.json"  # Uses final snapshot (includes 8.1 + 8.5)
         }
     
+    def get_mtime(self, step_key: str) -> Optional[float]:
+        """Returns the snapshot file modification time (None if missing)."""
+        path = self.snapshots.get(step_key)
+        if not path or not path.exists():
+            return None
+        return path.stat().st_mtime
+
     def load_snapshot(self, step_key: str) -> Dict:
         """Loads the raw JSON snapshot."""
         path = self.snapshots.get(step_key)
@@ -76,6 +83,10 @@ class SnapshotLoader:
             rows.append(row)
             
         df = pd.DataFrame(rows)
+        if not df.empty:
+            # Poucas UTPs para milhares de municípios: categoria faz nunique/groupby/isin
+            # operarem sobre os códigos inteiros
+            df['utp_id'] = df['utp_id'].astype('category')
         return df
 
     def get_geodataframe_for_step(self, step_key: str, base_gdf: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
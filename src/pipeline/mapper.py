@@ -31,7 +31,11 @@ class UTPMapGenerator:
                 else:
                     raise FileNotFoundError(f"Nenhum shapefile encontrado em {shp_dir}")
 
-            self.gdf_complete = gpd.read_file(shp_candidate)
+            # pyogrio + Arrow, lendo só os atributos usados no pipeline (as UTPs/RMs
+            # vêm do grafo em sync_with_graph); as demais colunas do DBF são ignoradas
+            self.gdf_complete = gpd.read_file(
+                shp_candidate, engine="pyogrio", use_arrow=True, columns=['CD_MUN', 'NM_MUN']
+            )
         except Exception as e:
             self.logger.error(f"Erro carregando shapefile de municípios: {e}")
             raise
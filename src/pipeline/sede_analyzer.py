@@ -12,6 +12,34 @@ from typing import Dict, List, Tuple, Optional
 import json
 
 
+# Colunas numéricas de indicadores lidas com sede.get(): quando todas as sedes
+# vêm sem valor a inferência do pandas produz coluna object; o dtype explícito
+# evita essa inferência e mantém o tipo estável entre execuções.
+SEDE_FLOAT_COLUMNS = [
+    'area_km2', 'aeroportos_100km', 'aeroportos_internacionais_100km',
+    'densidade_leitos_hospedagem', 'densidade_estabelecimentos_hospedagem',
+    'avaliacao_media_hospedagem', 'avaliacao_media_restaurante',
+    'estabelecimentos_turismo_mil_hab', 'ocupacoes_turismo_mil_hab',
+    'quociente_locacional_turismo', 'demanda_turistica', 'passageiros_onibus_turismo',
+    'rodoviarias', 'estabelecimentos_formais_mil_hab', 'ocupacoes_formais_mil_hab',
+    'renda_per_capita', 'remuneracao_media', 'ice_r',
+    'area_conservacao_ambiental_pct', 'densidade_patrimonio_cultural',
+    'cobertura_4g_pct', 'cobertura_5g_pct', 'densidade_banda_larga',
+    'medicos_100mil_hab', 'leitos_hospitalares_100mil_hab',
+    'estabelecimentos_saude_100mil_hab', 'leitos_uti_100mil_hab',
+    'taxa_homicidios_100mil_hab', 'proporcao_fluxo_principal', 'tempo_ate_destino_h'
+]
+SEDE_DTYPES = {
+    'populacao_total_utp': 'int64',
+    'populacao_sede': 'int64',
+    'num_municipios': 'int64',
+    'aeroporto_passageiros': 'int64',
+    'tem_aeroporto': 'bool',
+    'tem_alerta_dependencia': 'bool',
+    **{col: 'float64' for col in SEDE_FLOAT_COLUMNS}
+}
+
+
 class SedeAnalyzer:
     """
     Analisa dependências entre sedes de UTPs usando dados socioeconômicos e padrões de fluxo.
@@ -52,6 +80,9 @@ class SedeAnalyzer:
         # Dados agregados
         self.sede_metrics = {}
         self.dependency_alerts = []
+        
+        # Tabela origem-destino memoizada: (df_sede_analysis de origem, tabela)
+        self._od_comparison_cache = None
     
     def load_initialization_data(self) -> bool:
         """
@@ -458,7 +489,14 @@ class SedeAnalyzer:
             
             metrics_list.append(sede_metrics)
         
-        self.df_sede_analysis = pd.DataFrame(metrics_list)
+        if not metrics_list:
+            self.df_sede_analysis = pd.DataFrame(metrics_list)
+            return self.df_sede_analysis
+
+        # from_records + dtypes explícitos: monta as colunas direto dos registros
+        # sem a inferência de tipo por coluna do construtor padrão
+        df_metrics = pd.DataFrame.from_records(metrics_list, columns=list(metrics_list[0]))
+        self.df_sede_analysis = df_metrics.astype(SEDE_DTYPES)
         return self.df_sede_analysis
     
     def analyze_sede_dependencies(self) -> Dict:
@@ -552,9 +590,19 @@ class SedeAnalyzer:
         # Formatar tempo
         df_display['Tempo (h)'] = df_display['Tempo (h)'].round(2)
         
-        # Converter booleanos para símbolos
-        df_display['Aeroporto'] = df_display['Aeroporto'].map({True: 'Sim', False: ''})
-        df_display['Alerta'] = df_display['Alerta'].map({True: 'SIM', False: ''})
+        # Converter booleanos para símbolos: categorias com os próprios booleanos
+        # como códigos (0 = '', 1 = símbolo), sem map elemento a elemento;
+        # filtros como Alerta == 'SIM' comparam os códigos int8
+        df_display['Aeroporto'] = pd.Categorical.from_codes(
+            df_display['Aeroporto'].to_numpy(dtype='int8'), categories=['', 'Sim']
+        )
+        df_display['Alerta'] = pd.Categorical.from_codes(
+            df_display['Alerta'].to_numpy(dtype='int8'), categories=['', 'SIM']
+        )
+        
+        # REGIC como categoria: poucas classes distintas, opções/contagens
+        # saem de cat.categories sem varrer a coluna
+        df_display['REGIC'] = df_display['REGIC'].astype('category')
         
         return df_display
     
@@ -572,8 +620,16 @@ class SedeAnalyzer:
         if self.df_sede_analysis is None:
             return pd.DataFrame()
         
-        # Filtrar apenas sedes que têm principal destino que também é sede
-        df_with_destinations = self.df_sede_analysis.copy()
+        # Reaproveita a tabela enquanto a análise de sedes for a mesma
+        cached = self._od_comparison_cache
+        if cached is not None and cached[0] is self.df_sede_analysis:
+            return cached[1].copy()
+        
+        df_with_destinations = self.df_sede_analysis
+        
+        # Índice das sedes por código (primeira ocorrência), no lugar de um
+        # filtro sobre a tabela inteira a cada linha
+        sedes_by_cd = df_with_destinations.drop_duplicates('cd_mun_sede').set_index('cd_mun_sede', drop=False)
         
         # Criar lista para armazenar comparações
         comparisons = []
@@ -585,16 +641,12 @@ class SedeAnalyzer:
             if pd.isna(cd_destino):
                 continue
             
-            # Buscar dados da sede de destino
-            row_destino = df_with_destinations[
-                df_with_destinations['cd_mun_sede'] == cd_destino
-            ]
-            
-            if row_destino.empty:
+            if cd_destino not in sedes_by_cd.index:
                 # Destino não é uma sede, pular
                 continue
             
-            row_destino = row_destino.iloc[0]
+            # Buscar dados da sede de destino
+            row_destino = sedes_by_cd.loc[cd_destino]
             
             # Calcular diferenças
             delta_pop = row_destino['populacao_total_utp'] - row_origem['populacao_total_utp']
@@ -661,7 +713,8 @@ class SedeAnalyzer:
         if not df_comparison.empty:
             df_comparison = df_comparison.sort_values('Fluxo_%', ascending=False)
         
-        return df_comparison
+        self._od_comparison_cache = (self.df_sede_analysis, df_comparison)
+        return df_comparison.copy()
     
     def export_comprehensive_dependency_table(self) -> pd.DataFrame:
         """
@@ -0,0 +1,55 @@
+import sys
+from pathlib import Path
+
+import pandas as pd
+
+# Adicionar src ao path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from src.interface.dashboard import attach_municipio_uf, render_territory_metrics
+
+
+def make_municipios():
+    return pd.DataFrame({
+        'cd_mun': [1100015, 1100023, 3304557, 3550308],
+        'nm_mun': ['A', 'B', 'Rio', 'SP'],
+        'uf': pd.Categorical(['RO', 'RO', 'RJ', 'SP']),
+        'utp_id': pd.Categorical(['1', '1', '2', '3']),
+    })
+
+
+def make_step5_snapshot():
+    # Formato de SnapshotLoader.get_snapshot_dataframe: cd_mun em texto, sem "uf"
+    return pd.DataFrame({
+        'cd_mun': ['1100015', '1100023', '3304557'],
+        'utp_id': pd.Categorical(['1', '1', '2']),
+        'sede_utp': [True, False, True],
+        'regiao_metropolitana': ['', '', 'RM Rio'],
+        'nm_mun': ['A', 'B', 'Rio'],
+        'color_id': [0, 0, 1],
+    })
+
+
+def test_attach_municipio_uf_maps_text_codes():
+    df = attach_municipio_uf(make_step5_snapshot(), make_municipios())
+    assert df['uf'].tolist() == ['RO', 'RO', 'RJ']
+
+
+def test_tab2_metrics_on_step5_snapshot(monkeypatch):
+    """As métricas da aba 2 rodam sobre o snapshot step5 (que não tem "uf")."""
+    rendered = []
+
+    class FakeColumn:
+        def metric(self, label, value, delta=None):
+            rendered.append((label, value, delta))
+
+    monkeypatch.setattr('src.interface.dashboard.st.columns', lambda n: [FakeColumn() for _ in range(n)])
+
+    df_municipios = make_municipios()
+    df_m = attach_municipio_uf(make_step5_snapshot(), df_municipios)
+    render_territory_metrics(df_m, len(df_municipios), 3, 3)
+
+    assert rendered == [
+        ("Municípios", 3, "4 total"),
+        ("UTPs", 2, "3 total"),
+        ("Estados", 2, "3 total"),
+    ]
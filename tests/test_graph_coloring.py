@@ -0,0 +1,55 @@
+import sys
+from pathlib import Path
+
+import geopandas as gpd
+import networkx as nx
+import numpy as np
+import shapely.geometry as sgeom
+
+# Adicionar src ao path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from src.core.graph import TerritorialGraph
+
+
+def make_gdf():
+    # A e B vizinhas (dois municípios em A), C isolada; a linha sem UTP é descartada
+    return gpd.GeoDataFrame({
+        'UTP_ID': ['A', 'A', 'B', 'C', None],
+        'CD_MUN': ['1', '2', '3', '4', '5'],
+        'geometry': [
+            sgeom.box(0, 0, 0.5, 1),
+            sgeom.box(0.5, 0, 1, 1),
+            sgeom.box(1, 0, 2, 1),
+            sgeom.box(5, 5, 6, 6),
+            sgeom.box(9, 9, 10, 10),
+        ],
+    }, crs="EPSG:4326")
+
+
+def test_coloring_maps_every_municipality_by_int_code():
+    coloring = TerritorialGraph().compute_graph_coloring(make_gdf())
+
+    assert coloring == {1: 0, 2: 0, 3: 1, 4: 0}
+    assert all(isinstance(k, int) and isinstance(v, int) for k, v in coloring.items())
+
+
+def test_coloring_defaults_missing_utps_to_zero(monkeypatch):
+    # Coloração parcial: UTPs fora do utp_color_map caem no fillna(0)
+    monkeypatch.setattr(nx.coloring, 'greedy_color', lambda G, strategy=None: {'B': 2})
+
+    coloring = TerritorialGraph().compute_graph_coloring(make_gdf())
+
+    assert coloring == {1: 0, 2: 0, 3: 2, 4: 0}
+
+
+def test_coloring_handles_numeric_utp_ids():
+    gdf = make_gdf().dropna(subset=['UTP_ID'])
+    gdf['UTP_ID'] = gdf['UTP_ID'].map({'A': 10, 'B': 20, 'C': 30}).astype(np.int64)
+
+    coloring = TerritorialGraph().compute_graph_coloring(gdf)
+
+    assert coloring == {1: 0, 2: 0, 3: 1, 4: 0}
+
+
+def test_coloring_empty_frame():
+    assert TerritorialGraph().compute_graph_coloring(None) == {}
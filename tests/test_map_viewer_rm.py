@@ -0,0 +1,44 @@
+import sys
+from pathlib import Path
+
+import geopandas as gpd
+from shapely.geometry import box
+
+# Adicionar src ao path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from src.interface.components.map_viewer import create_interactive_map, get_rm_name_index
+
+
+def make_rms():
+    return gpd.GeoDataFrame({
+        'NOME': ['RM de Natal', 'Grande São Luís', 'RM Vale', 'RM VALE', 'RM Distante'],
+        'UF_SIGLA': ['RN', 'MA', 'SP', 'RJ', 'AM'],
+        'MUNICIPIO': [1, 1, 1, 1, 1],
+    }, geometry=[box(0, 0, 1, 1), box(1, 0, 2, 1), box(2, 0, 3, 1), box(3, 0, 4, 1), box(50, 50, 51, 51)], crs=4326)
+
+
+def make_municipios():
+    return gpd.GeoDataFrame({
+        'CD_MUN': ['1', '2', '3', '4'],
+        'NM_MUN': ['a', 'b', 'c', 'd'],
+        'UTP_ID': ['1', '1', '2', '3'],
+        # "Natal" e "São Luís" não batem com o NOME do shapefile; "RM Vale" colide
+        'regiao_metropolitana': ['Natal', 'RM da Grande São Luís', 'RM Vale', ''],
+    }, geometry=[box(0.1, 0.1, 0.9, 0.9), box(1.1, 0.1, 1.9, 0.9), box(2.1, 0.1, 2.9, 0.9), box(5, 5, 6, 6)], crs=4326)
+
+
+def rm_tooltips(html):
+    # Tooltip "RM: <nome> (<UF>) - ...": a UF identifica a RM (nomes podem vir escapados no JSON)
+    return {uf for uf in make_rms()['UF_SIGLA'] if f"({uf}) - " in html}
+
+
+def test_rm_name_index_keeps_colliding_names():
+    index = get_rm_name_index(make_rms())
+    assert index['rm vale'] == [2, 3]
+
+
+def test_rm_borders_include_unmatched_names_via_spatial_join():
+    m = create_interactive_map(make_municipios(), {}, {}, gdf_rm=make_rms(), show_rm_borders=True)
+    html = m.get_root().render()
+    # Nome casado (com colisão: ambas as RMs), e as duas RMs de nome divergente via sjoin
+    assert rm_tooltips(html) == {'RN', 'MA', 'SP', 'RJ'}
@@ -0,0 +1,59 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# Adicionar src ao path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from src.interface.consolidation_loader import ConsolidationLoader
+
+
+# Cadeias de vários saltos (131->152->672, 1->2->3->4), um ciclo (7<->8) e uma UTP solta
+MAPPING = {'131': '152', '152': '672', '1': '2', '2': '3', '3': '4', '7': '8', '8': '7', '999': '1000'}
+UTP_IDS = ['131', '152', '672', '1', '2', '3', '4', '7', '8', '999', '555', '131']
+
+
+def resolve_per_row(loader, utp_ids, mapping):
+    # Comportamento anterior: cadeia resolvida linha a linha
+    return utp_ids.apply(lambda x: loader._resolve_mapping_chain(x, mapping))
+
+
+def test_resolve_utp_column_multi_hop_chains():
+    loader = ConsolidationLoader()
+    utp_ids = pd.Series(UTP_IDS, index=range(10, 22))
+
+    resolved = loader._resolve_utp_column(utp_ids, MAPPING)
+
+    assert resolved.tolist() == ['672', '672', '672', '4', '4', '4', '4', '7', '8', '1000', '555', '672']
+    assert resolved.index.equals(utp_ids.index)
+    assert resolved.tolist() == resolve_per_row(loader, utp_ids, MAPPING).tolist()
+
+
+def test_resolve_utp_column_categorical_and_missing():
+    loader = ConsolidationLoader()
+    utp_ids = pd.Series(pd.Categorical(UTP_IDS + [np.nan]))
+
+    resolved = loader._resolve_utp_column(utp_ids, MAPPING)
+
+    # Não sai categórica: UTPs de destino fora das categorias originais e NaN preservado
+    assert not isinstance(resolved.dtype, pd.CategoricalDtype)
+    assert resolved.iloc[:-1].tolist() == resolve_per_row(loader, utp_ids.astype(object).iloc[:-1], MAPPING).tolist()
+    assert pd.isna(resolved.iloc[-1])
+    assert resolved.fillna('-').iloc[-1] == '-'
+
+
+def test_apply_consolidations_follows_chains():
+    loader = ConsolidationLoader()
+    df = pd.DataFrame({
+        'utp_id': pd.Categorical(['131', '152', '672', '999']),
+        'sede_utp': [True, True, True, True],
+        'nm_mun': ['A', 'B', 'C', 'D'],
+        'nm_sede': ['A', 'B', 'C', 'D'],
+    })
+
+    result = loader.apply_consolidations_to_dataframe(df, custom_mapping=MAPPING)
+
+    assert result['utp_id'].tolist() == ['672', '672', '672', '1000']
+    assert result['sede_utp'].tolist() == [False, False, True, False]
+    assert result['nm_sede'].tolist() == ['C', 'C', 'C', '']
@@ -0,0 +1,94 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# Adicionar src ao path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from src.interface.dashboard import create_enriched_utp_summary
+
+
+def make_municipios():
+    return pd.DataFrame({
+        # Categoria "99" sem municípios: não pode gerar linha no resumo
+        'utp_id': pd.Categorical(['10', '10', '10', '20', '20', '30'], categories=['10', '20', '30', '99']),
+        'nm_mun': ['A', 'B', 'C', 'D', 'E', 'F'],
+        'uf': ['SP', 'SP', 'SP', 'MG', 'MG', 'RJ'],
+        'sede_utp': [True, False, False, True, False, False],
+        # Empates no maior município: A/B na UTP 10, D/E na UTP 20
+        'populacao_2022': [500, 500, 100, 300, 300, 50],
+        'area_km2': [10.0, 20.0, 30.0, 40.0, 50.0, 60.0],
+        'turismo_classificacao': ['A - Alto', None, None, np.nan, None, None],
+        'regic': ['Metrópole', '', '', '', '', ''],
+        'regiao_metropolitana': ['RM X', None, None, np.nan, None, None],
+        # Modais/aeroporto ausentes (None, NaN ou dict vazio) em parte das linhas
+        'modais': [
+            {'rodoviaria_coletiva': 10, 'aeroviaria': 30},
+            None,
+            {},
+            np.nan,
+            {'rodoviaria_particular': 5},
+            None,
+        ],
+        'aeroporto': [
+            {'sigla': 'GRU', 'passageiros_anual': 2500000},
+            {'sigla': '', 'icao': 'SBKP', 'passageiros_anual': 1500},
+            np.nan,
+            None,
+            None,
+            {'sigla': 'SDU', 'passageiros_anual': 10},
+        ],
+    })
+
+
+def test_summary_rows_and_order():
+    summary = create_enriched_utp_summary(make_municipios())
+
+    # UTP 30 não tem sede: fica fora do resumo; ordenado por população
+    assert summary['UTP'].astype(str).tolist() == ['10', '20']
+    assert summary['Sede'].tolist() == ['A', 'D']
+    assert summary['UF'].tolist() == ['SP', 'MG']
+    assert summary['Municípios'].tolist() == [3, 2]
+    assert summary['População'].tolist() == [1100, 600]
+
+
+def test_summary_ties_on_max_population_keep_first():
+    summary = create_enriched_utp_summary(make_municipios()).set_index('UTP')
+
+    assert summary.loc['10', 'Maior Município'] == 'A (500)'
+    assert summary.loc['20', 'Maior Município'] == 'D (300)'
+
+
+def test_summary_missing_modais_and_aeroporto():
+    summary = create_enriched_utp_summary(make_municipios()).set_index('UTP')
+
+    assert summary.loc['10', 'Viagens'] == 40
+    assert summary.loc['10', 'Modal'] == 'Aérea'
+    assert summary.loc['10', 'Aeroportos'] == '2 aeros | GRU (2.5M)'
+    assert summary.loc['10', '_n_aero'] == 2
+
+    # Modal vem da sede (sem modais); viagens somam os demais municípios
+    assert summary.loc['20', 'Viagens'] == 5
+    assert summary.loc['20', 'Modal'] == '-'
+    assert summary.loc['20', 'Aeroportos'] == '-'
+    assert summary.loc['20', '_n_aero'] == 0
+
+    assert summary.loc['10', 'REGIC'] == 'Metrópole'
+    assert summary.loc['10', 'RM'] == 'RM X'
+    assert summary.loc['10', 'Turismo'] == 'A'
+    assert summary.loc['20', ['REGIC', 'RM', 'Turismo']].tolist() == ['-', '-', '-']
+
+
+def test_summary_without_modais_and_aeroporto_columns():
+    df = make_municipios().drop(columns=['modais', 'aeroporto'])
+    summary = create_enriched_utp_summary(df)
+
+    assert summary['Viagens'].tolist() == [0, 0]
+    assert summary['Modal'].tolist() == ['-', '-']
+    assert summary['Aeroportos'].tolist() == ['-', '-']
+    assert summary['_n_aero'].tolist() == [0, 0]
+
+
+def test_summary_empty_frame():
+    assert create_enriched_utp_summary(pd.DataFrame()).empty